@@ -0,0 +1,216 @@
+"""
+Benchmarks HW5 solutions over a grid of network conditions.
+
+Every combination of the given loss rates, delays, buffer sizes and file
+sizes is run through tester.py, several times over, with runs spread over
+parallel workers that each use their own port.  Per run results are
+written as CSV, and results per configuration (medians over the runs) as
+JSON.  Given the JSON of an earlier benchmark as a baseline, configurations
+whose goodput dropped by more than the tolerance are flagged as regressions.
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import queue
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DESC = sys.modules[globals()['__name__']].__doc__
+PARSER = argparse.ArgumentParser(description=DESC)
+PARSER.add_argument('-l', '--loss', type=float, nargs="+", default=[0.0, 0.05],
+                    help="The packet loss rates to test (defaults to 0 and "
+                         "0.05).")
+PARSER.add_argument('-d', '--delay', type=float, nargs="+",
+                    default=[0.0, 0.02],
+                    help="The delays, in seconds, to test (defaults to 0 and "
+                         "0.02).")
+PARSER.add_argument('-b', '--buffer', type=int, nargs="+", default=[10, 100],
+                    help="The wire buffer sizes to test (defaults to 10 and "
+                         "100).")
+PARSER.add_argument('-z', '--size', type=int, nargs="+", default=[100000],
+                    help="The sizes, in bytes, of the files to send "
+                         "(defaults to 100000).  Files are random, and the "
+                         "same for every run of a size.")
+PARSER.add_argument('-r', '--repeat', type=int, default=3,
+                    help="The number of times to run each configuration "
+                         "(defaults to 3).  Run i seeds the wire with i, so "
+                         "benchmarks can be compared run for run.")
+PARSER.add_argument('-j', '--jobs', type=int, default=4,
+                    help="The number of runs to do at once (defaults to 4).")
+PARSER.add_argument('-p', '--port', type=int, default=9100,
+                    help="The first port to simulate wires on; each job uses "
+                         "the next one up (defaults to 9100).")
+PARSER.add_argument('-t', '--timeout', type=float, default=300,
+                    help="The number of seconds after which a run is "
+                         "counted as failed (defaults to 300).")
+PARSER.add_argument('--tester-args', default="",
+                    help="Extra arguments to pass to every tester.py run, "
+                         "such as \"--fec\".")
+PARSER.add_argument('--csv', default=None,
+                    help="A path to write the result of every run to, as "
+                         "CSV.")
+PARSER.add_argument('--json', default=None,
+                    help="A path to write the results of each configuration "
+                         "to, as JSON, for use as a later --baseline.")
+PARSER.add_argument('--baseline', default=None,
+                    help="The --json output of an earlier benchmark to "
+                         "compare against.")
+PARSER.add_argument('--tolerance', type=float, default=0.1,
+                    help="The fraction by which median goodput may drop "
+                         "below the baseline before it counts as a "
+                         "regression (defaults to 0.1).")
+ARGS = PARSER.parse_args()
+
+PYTHON_BINARY = sys.executable
+CONFIG_FIELDS = ("loss", "delay", "buffer", "size")
+RUN_FIELDS = CONFIG_FIELDS + ("repeat", "success", "seconds", "goodput",
+                              "throughput", "retransmit_ratio")
+
+
+def make_input(directory: str, size: int) -> str:
+    """Writes a file of `size` random bytes, the same for every call with
+    that size, and returns its path."""
+    path = os.path.join(directory, "input-{}.bin".format(size))
+    data = random.Random(size).getrandbits(8 * size).to_bytes(size, "little")
+    with open(path, "wb") as handle:
+        handle.write(data)
+    return path
+
+
+def run_once(config: dict, repeat: int, path: str, ports: queue.Queue,
+             directory: str) -> dict:
+    """Runs tester.py for one configuration, and returns the run's row."""
+    port = ports.get()
+    result_path = os.path.join(directory, "result-{}.json".format(port))
+    if os.path.exists(result_path):
+        # so a run that dies before writing its result can't pick up the
+        # result of the last run on this port
+        os.remove(result_path)
+    args = [PYTHON_BINARY, "tester.py", "--summary",
+            "--port", str(port),
+            "--loss", str(config["loss"]),
+            "--delay", str(config["delay"]),
+            "--buffer", str(config["buffer"]),
+            "--seed", str(repeat),
+            "--file", path,
+            "--receive", os.path.join(directory, "output-{}".format(port)),
+            "--json", result_path] + ARGS.tester_args.split()
+    row = dict(config, repeat=repeat, success=False, seconds=None,
+               goodput=None, throughput=None, retransmit_ratio=None)
+    # tester.py gets its own process group, so that a run that times out can
+    # be killed along with the server, sender and receiver it started
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        process.wait(timeout=ARGS.timeout)
+        with open(result_path) as handle:
+            result = json.load(handle)
+    except (subprocess.TimeoutExpired, OSError, ValueError) as error:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        print("Run {} of {} failed: {}".format(repeat, config, error),
+              file=sys.stderr)
+        return row
+    finally:
+        ports.put(port)
+
+    seconds = result["seconds"]
+    sender = result["sender"] or {}
+    segments = sender.get("segments_sent", 0)
+    row["success"] = result["success"]
+    row["seconds"] = round(seconds, 4)
+    row["goodput"] = round(result["received_bytes"] / seconds / 1000, 2)
+    if sender:
+        row["throughput"] = round(sender["bytes_sent"] / seconds / 1000, 2)
+        row["retransmit_ratio"] = round(
+            sender["retransmits"] / segments if segments else 0, 4)
+    return row
+
+
+def median(rows: list, field: str):
+    """Returns the median of a field over the rows that have it, or None."""
+    values = [row[field] for row in rows if row[field] is not None]
+    return round(statistics.median(values), 4) if values else None
+
+
+def summarize(config: dict, rows: list) -> dict:
+    """Combines the runs of one configuration."""
+    return dict(config,
+                runs=len(rows),
+                failures=sum(not row["success"] for row in rows),
+                seconds=median(rows, "seconds"),
+                goodput=median(rows, "goodput"),
+                throughput=median(rows, "throughput"),
+                retransmit_ratio=median(rows, "retransmit_ratio"))
+
+
+def config_key(config: dict) -> tuple:
+    """Returns what identifies a configuration, for matching up results."""
+    return tuple(config[field] for field in CONFIG_FIELDS)
+
+
+CONFIGS = [dict(zip(CONFIG_FIELDS, values)) for values in itertools.product(
+    ARGS.loss, ARGS.delay, ARGS.buffer, ARGS.size)]
+
+with tempfile.TemporaryDirectory() as WORK_DIR:
+    INPUTS = {size: make_input(WORK_DIR, size) for size in ARGS.size}
+    PORTS = queue.Queue()
+    for A_PORT in range(ARGS.port, ARGS.port + ARGS.jobs):
+        PORTS.put(A_PORT)
+
+    with concurrent.futures.ThreadPoolExecutor(ARGS.jobs) as POOL:
+        FUTURES = [POOL.submit(run_once, config, repeat,
+                               INPUTS[config["size"]], PORTS, WORK_DIR)
+                   for config in CONFIGS for repeat in range(ARGS.repeat)]
+        ROWS = [future.result() for future in FUTURES]
+
+SUMMARIES = [summarize(config, [row for row in ROWS
+                                if config_key(row) == config_key(config)])
+             for config in CONFIGS]
+
+BASELINE = {}
+if ARGS.baseline:
+    with open(ARGS.baseline) as BASELINE_FILE:
+        BASELINE = {config_key(summary): summary
+                    for summary in json.load(BASELINE_FILE)}
+
+REGRESSIONS = 0
+TEMPLATE = ("loss={loss} delay={delay} buffer={buffer} size={size}: "
+            "goodput={goodput} KB/s, throughput={throughput} KB/s, "
+            "retransmits={retransmit_ratio}, time={seconds}s, "
+            "failures={failures}/{runs}")
+for SUMMARY in SUMMARIES:
+    LINE = TEMPLATE.format(**SUMMARY)
+    BEFORE = BASELINE.get(config_key(SUMMARY))
+    if BEFORE is not None and BEFORE["goodput"] and SUMMARY["goodput"]:
+        CHANGE = SUMMARY["goodput"] / BEFORE["goodput"] - 1
+        SUMMARY["baseline_goodput"] = BEFORE["goodput"]
+        SUMMARY["regression"] = CHANGE < -ARGS.tolerance
+        LINE += " ({:+.1%} vs baseline)".format(CHANGE)
+        if SUMMARY["regression"]:
+            LINE = "[REGRESSION] " + LINE
+            REGRESSIONS += 1
+    if SUMMARY["failures"]:
+        LINE = "[FAILED] " + LINE
+    print(LINE)
+
+if ARGS.csv:
+    with open(ARGS.csv, "w", newline="") as CSV_FILE:
+        WRITER = csv.DictWriter(CSV_FILE, fieldnames=RUN_FIELDS)
+        WRITER.writeheader()
+        WRITER.writerows(ROWS)
+
+if ARGS.json:
+    with open(ARGS.json, "w") as JSON_FILE:
+        json.dump(SUMMARIES, JSON_FILE, indent=2)
+
+FAILED = any(SUMMARY["failures"] for SUMMARY in SUMMARIES)
+sys.exit(1 if REGRESSIONS or FAILED else 0)
@@ -0,0 +1,174 @@
+"""
+In-process harness for testing HW5 solutions under user set conditions.
+
+Runs the lossy wire, the receiver and the sender on a single event loop in
+this process (using the asyncio versions in hw5_async), so a run costs no
+interpreter start ups and no waiting for other processes to get ready.
+Both ends of the transfer are hashed as the data streams through them, so
+nothing is read from or written to disk twice.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import homework5.logging
+import homework5.utils
+import homework5.wire
+import hw5
+import hw5_async
+
+
+async def run_transfer(path: str, loss: float = 0.0, delay: float = 0.0,
+                       buffer_size: int = 2, window: int = hw5.DEFAULT_WINDOW,
+                       fec: bool = False, compression: str = None,
+                       profile: homework5.wire.LinkProfile = None) -> dict:
+    """
+    Sends a file over a fresh wire, on the running event loop.
+
+    Args:
+        path -- The file to send.
+        loss, delay, buffer_size, profile -- The conditions on the wire, as
+            for `homework5.wire.CrummyWireProtocol`.
+        window, fec, compression -- As for `hw5_async.send_stream`.
+
+    Return:
+        A dict of whether the data arrived intact, how long it took to send
+        (from the start of the send to the sender finishing, as tester.py
+        measures it), the sizes and hashes of both ends, and the sender's
+        and receiver's `hw5.TransferStats`.
+    """
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: homework5.wire.CrummyWireProtocol(loop, loss, delay,
+                                                  buffer_size, profile),
+        local_addr=(hw5_async.WIRE_HOST, 0))
+    port = transport.get_extra_info("sockname")[1]
+    dest = homework5.utils.HashingWriter()
+    send_stats = hw5.TransferStats()
+    recv_stats = hw5.TransferStats()
+    try:
+        with open(path, "rb") as handle:
+            source = homework5.utils.HashingReader(handle)
+            received = await hw5_async.connect_receiver(
+                port, lambda stream: dest, stats=recv_stats)
+            start = time.monotonic()
+            await hw5_async.send_stream(port, source, window, fec,
+                                        send_stats, compression)
+            seconds = time.monotonic() - start
+            await received
+    finally:
+        transport.close()
+
+    return {
+        "success": source.hexdigest() == dest.hexdigest(),
+        "seconds": seconds,
+        "input_bytes": source.size,
+        "input_hash": source.hexdigest(),
+        "received_bytes": dest.size,
+        "received_hash": dest.hexdigest(),
+        "sender": send_stats.as_dict(),
+        "receiver": recv_stats.as_dict(),
+    }
+
+
+if __name__ == "__main__":
+    DESC = sys.modules[globals()['__name__']].__doc__
+    PARSER = argparse.ArgumentParser(description=DESC)
+    PARSER.add_argument('-l', '--loss', type=float, default=0.0,
+                        help="The percentage of packets to drop.")
+    PARSER.add_argument('-d', '--delay', type=float, default=0.0,
+                        help="The number of seconds, as a float, to wait "
+                             "before forwarding a packet on.")
+    PARSER.add_argument('-b', '--buffer', type=int, default=2,
+                        help="The size of the buffer to simulate (defaults "
+                             "to 2 packets).")
+    PARSER.add_argument('--profile', default=None,
+                        help="A JSON file of link profile fields for the "
+                             "wire (see server.py --help).")
+    PARSER.add_argument('--corrupt', type=float, default=None,
+                        help="The chance of the wire flipping a bit in a "
+                             "packet.")
+    PARSER.add_argument('--seed', type=int, default=None,
+                        help="Seed for the wire's random choices, so a run "
+                             "can be repeated exactly.")
+    PARSER.add_argument('-w', '--window', type=int,
+                        default=hw5.DEFAULT_WINDOW,
+                        help="The number of unacknowledged packets the "
+                             "sender keeps in flight (defaults to "
+                             "{}).".format(hw5.DEFAULT_WINDOW))
+    PARSER.add_argument('--fec', action="store_true",
+                        help="Have the sender send parity packets.")
+    PARSER.add_argument('-c', '--compress', choices=sorted(hw5.CODECS),
+                        default=None,
+                        help="Have the sender compress the file with this "
+                             "codec.")
+    PARSER.add_argument('-f', '--file', required=True,
+                        help="The file to send over the wire.")
+    PARSER.add_argument('-t', '--timeout', type=float, default=None,
+                        help="The number of seconds to give the transfer "
+                             "before counting it as failed.")
+    PARSER.add_argument('-s', '--summary', action="store_true",
+                        help="Print a one line summary of whether the "
+                             "transaction was successful, instead of a more "
+                             "verbose description of the result.")
+    PARSER.add_argument('--json', default=None,
+                        help="A path to write the results to as a JSON "
+                             "object.")
+    PARSER.add_argument('-v', '--verbose', action="store_true",
+                        help="Enable extra verbose mode.")
+    ARGS = PARSER.parse_args()
+
+    if ARGS.verbose:
+        for A_NAME in ("hw5-wire", "hw5-sender", "hw5-receiver"):
+            homework5.logging.get_logger(A_NAME).setLevel(logging.DEBUG)
+
+    PROFILE = (homework5.wire.LinkProfile.load(ARGS.profile) if ARGS.profile
+               else homework5.wire.LinkProfile())
+    if ARGS.corrupt is not None:
+        PROFILE.corrupt = ARGS.corrupt
+    if ARGS.seed is not None:
+        PROFILE.seed = ARGS.seed
+
+    try:
+        RESULT = asyncio.run(asyncio.wait_for(
+            run_transfer(ARGS.file, ARGS.loss, ARGS.delay, ARGS.buffer,
+                         ARGS.window, ARGS.fec, ARGS.compress, PROFILE),
+            ARGS.timeout))
+    except asyncio.TimeoutError:
+        print("[TIMEOUT] transfer did not finish in {} seconds".format(
+            ARGS.timeout))
+        sys.exit(1)
+
+    if ARGS.json:
+        with open(ARGS.json, "w") as JSON_FILE:
+            json.dump(RESULT, JSON_FILE)
+
+    RATE = round(RESULT["received_bytes"] / RESULT["seconds"] / 1000, 2)
+    if ARGS.summary:
+        TEMPLATE = ("[{}] latency={}ms, packet loss={}%, buffer={}, "
+                    "throughput={} Kb/s")
+        print(TEMPLATE.format(
+            "SUCCESS" if RESULT["success"] else "INCORRECT",
+            round(ARGS.delay * 1000),
+            round(ARGS.loss * 100, 2),
+            ARGS.buffer,
+            RATE
+        ))
+    else:
+        print("Success" if RESULT["success"] else "Incorrect")
+        print("===\n")
+        print("Input\n---\nFile: {}\nLength: {}\nHash: {}\n".format(
+            ARGS.file, RESULT["input_bytes"], RESULT["input_hash"]))
+        print("Received\n---\nLength: {}\nHash: {}\n".format(
+            RESULT["received_bytes"], RESULT["received_hash"]))
+        print("Stats\n---\nTime: {} secs\nRate: {} kB/s".format(
+            round(RESULT["seconds"], 2), RATE))
+        for A_FIELD, A_VALUE in RESULT["sender"].items():
+            if A_VALUE:
+                print("Sender {}: {}".format(A_FIELD, A_VALUE))
+        for A_FIELD, A_VALUE in RESULT["receiver"].items():
+            if A_VALUE:
+                print("Receiver {}: {}".format(A_FIELD, A_VALUE))
+    sys.exit(0 if RESULT["success"] else 1)
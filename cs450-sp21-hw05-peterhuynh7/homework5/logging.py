@@ -1,18 +1,41 @@
 """
 Code for getting and configuring a logger for hw5.
+
+Every logger hands its records to a queue, and a single background thread
+writes them to STDOUT, so logging never blocks the sending, receiving or
+wire loops on terminal output.
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
+_QUEUE = queue.SimpleQueue()
+_QUEUE_HANDLER = logging.handlers.QueueHandler(_QUEUE)
+_LISTENER = None
+
+
+def _start_listener():
+    global _LISTENER
+    handler = logging.StreamHandler(sys.stdout)
+    formatter = logging.Formatter('%(asctime)s - %(name)s: %(message)s')
+    handler.setFormatter(formatter)
+    _LISTENER = logging.handlers.QueueListener(_QUEUE, handler)
+    _LISTENER.start()
+    # write out whatever is still queued when the process exits
+    atexit.register(_LISTENER.stop)
+
 
 def get_logger(log_name: str) -> logging.Logger:
     """Returns a logging instance, configured so that all non-filtered messages
-    are sent to STDOUT.
+    are sent to STDOUT.  Safe to call any number of times for the same name;
+    the logger's handler is only added once.
     """
+    if _LISTENER is None:
+        _start_listener()
     logger = logging.getLogger(log_name)
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('%(asctime)s - %(name)s: %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    if _QUEUE_HANDLER not in logger.handlers:
+        logger.addHandler(_QUEUE_HANDLER)
     return logger
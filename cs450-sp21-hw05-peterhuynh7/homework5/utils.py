@@ -1,25 +1,146 @@
 """
 Shared utilities for testing implementations of HW5.
 """
+import os
+import select
 import pathlib
 import typing
 import hashlib
+import concurrent.futures
 
-def file_summary(path: pathlib.Path) -> typing.Tuple[int, str]:
+
+# Size of the blocks files are hashed in, so memory use stays fixed however
+# large the file.
+SUMMARY_CHUNK = 1 << 20
+
+
+def file_summary(path: pathlib.Path,
+                 chunk_size: int = SUMMARY_CHUNK) -> typing.Tuple[int, str]:
     """Reads a file off disk, and returns the size of the file and the sha256
-    hash of it.
+    hash of it.  The file is read a block at a time into one reused buffer,
+    so only `chunk_size` bytes of it are ever in memory.
 
     Args:
         path -- A path to a file that should be summarized.
+        chunk_size -- The number of bytes to read and hash at a time.
 
     Return:
         Two values, first the size of the file, in bytes, and second, the
         sha256 hex digest of the contents of the file.
     """
-    with open(path, 'rb') as handle:
-        data: bytes = handle.read()
-        data_len: int = len(data)
-        hasher = hashlib.sha256()
-        hasher.update(data)
-        hash_hex: str = hasher.hexdigest()
-    return data_len, hash_hex
+    hasher = hashlib.sha256()
+    data_len = 0
+    buffer = memoryview(bytearray(chunk_size))
+    with open(path, 'rb', buffering=0) as handle:
+        while True:
+            size = handle.readinto(buffer)
+            if not size:
+                break
+            hasher.update(buffer[:size])
+            data_len += size
+    return data_len, hasher.hexdigest()
+
+
+def file_summaries(paths: typing.Iterable[pathlib.Path],
+                   chunk_size: int = SUMMARY_CHUNK,
+                   max_workers: int = None) -> typing.Iterator[
+                       typing.Tuple[pathlib.Path, typing.Tuple[int, str]]]:
+    """Summarizes several files at once, each in its own thread (hashing
+    large blocks runs outside the GIL, so the files really are hashed in
+    parallel), and yields each file's summary as soon as it is ready.
+
+    Args:
+        paths -- Paths to the files that should be summarized.
+        chunk_size -- As for `file_summary`.
+        max_workers -- The most files to hash at once (defaults to all of
+                       them).
+
+    Return:
+        An iterator of (path, (size, hash)) pairs, in the order the files
+        finish, rather than the order they were given in.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers or len(paths)) as pool:
+        futures = {pool.submit(file_summary, path, chunk_size): path
+                   for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+
+class HashingReader:
+    """Wraps a binary file object, keeping the size and sha256 hash of
+    everything read from it, so data can be summarized as it is sent
+    instead of being read a second time.
+    """
+
+    def __init__(self, readable: typing.BinaryIO):
+        self._readable = readable
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Reads from the wrapped file, counting what comes back."""
+        data = self._readable.read(size)
+        self._hasher.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        """The sha256 hex digest of everything read so far."""
+        return self._hasher.hexdigest()
+
+
+class HashingWriter:
+    """A write only destination that keeps just the size and sha256 hash of
+    what is written to it, for checking received data without storing it.
+    """
+
+    def __init__(self):
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        """Counts the data, and returns its length as a file would."""
+        self._hasher.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        """Does nothing, since nothing is buffered."""
+
+    def hexdigest(self) -> str:
+        """The sha256 hex digest of everything written so far."""
+        return self._hasher.hexdigest()
+
+
+def signal_ready(ready_fd: int):
+    """Tells a parent process that a child is ready, by writing a byte to,
+    and closing, the write end of a pipe the parent handed it.
+
+    Args:
+        ready_fd -- The file descriptor of the write end of the pipe.
+    """
+    os.write(ready_fd, b"\n")
+    os.close(ready_fd)
+
+
+def wait_ready(ready_fd: int, timeout: float) -> bool:
+    """Waits for a child process to call `signal_ready` on the other end of
+    a pipe, and closes the read end.
+
+    Args:
+        ready_fd -- The file descriptor of the read end of the pipe.
+        timeout -- The longest time, in seconds, to wait.
+
+    Return:
+        True if the child signalled it was ready, and False if it exited or
+        the timeout passed first.
+    """
+    try:
+        readable, _, _ = select.select([ready_fd], [], [], timeout)
+        return bool(readable) and os.read(ready_fd, 1) == b"\n"
+    finally:
+        os.close(ready_fd)
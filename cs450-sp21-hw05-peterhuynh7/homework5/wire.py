@@ -3,6 +3,8 @@ Implementation of an async based lossy wire, that simulates network
 conditions between two communicating sockets.
 """
 import asyncio
+import collections
+import json
 import random
 import socket
 import binascii
@@ -26,15 +28,177 @@ def data_rep(data: bytes) -> str:
     return sha1er.hexdigest()
 
 
+class LazyDataRep:
+    """Stands in for `data_rep(data)` as a logging argument, so the
+    depiction (a SHA-1 of the data, for anything long) is only worked out
+    if the message is actually written."""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def __str__(self):
+        return str(data_rep(self._data))
+
+
+# The first datagram every peer sends.  Peers that add the same link name
+# (b"connect <name>") are paired with each other; peers that send it bare
+# are paired in the order they connect.
+CONNECT = b'connect'
+
+
+def connect_message(link: str = None) -> bytes:
+    """Returns the datagram that connects a peer to the wire, optionally on
+    a named link."""
+    if link is None:
+        return CONNECT
+    return CONNECT + b' ' + link.encode("utf-8")
+
+
+JITTER_DISTRIBUTIONS = ("uniform", "normal", "exponential")
+
+
+class LinkProfile:
+    """
+    Conditions on the wire beyond its loss, delay and buffer size: the
+    bottleneck's bandwidth, jitter and reordering past it, bursts of loss
+    (a Gilbert-Elliott model, where a link flips between a good state with
+    the wire's usual loss and a bad state with `burst_loss`), and damage to
+    the packets that do get through.  Each link draws from its own RNG,
+    seeded from `seed` and the link's number, so a run can be repeated
+    exactly.
+
+    Fields:
+        bandwidth -- Bytes per second the bottleneck serializes, or 0 for
+                     no limit.
+        jitter -- Scale, in seconds, of the extra delay added to each
+                  packet past the bottleneck, drawn from `jitter_dist`: up
+                  to `jitter` for "uniform", the size of a normal sample
+                  with that deviation for "normal", or with that mean for
+                  "exponential".
+        reorder -- Chance of holding a packet back an extra
+                   `reorder_delay` seconds, so packets behind it overtake.
+        burst_enter, burst_exit -- Chance, per packet, of moving to the bad
+                                   state and back to the good one.
+        burst_loss -- Chance of dropping a packet in the bad state.
+        corrupt -- Chance of flipping a random bit of a packet that isn't
+                   dropped.
+        seed -- Seed for the links' RNGs; None for a fresh one per run.
+    """
+
+    FIELDS = {"bandwidth": 0.0, "jitter": 0.0, "jitter_dist": "uniform",
+              "reorder": 0.0, "reorder_delay": 0.01, "burst_enter": 0.0,
+              "burst_exit": 1.0, "burst_loss": 1.0, "corrupt": 0.0,
+              "seed": None}
+
+    def __init__(self, **fields):
+        unknown = set(fields) - set(self.FIELDS)
+        if unknown:
+            raise ValueError("Unknown link profile fields: {}".format(
+                ", ".join(sorted(unknown))))
+        for field, default in self.FIELDS.items():
+            setattr(self, field, fields.get(field, default))
+        if self.jitter_dist not in JITTER_DISTRIBUTIONS:
+            raise ValueError("Unknown jitter distribution {!r}".format(
+                self.jitter_dist))
+
+    @classmethod
+    def load(cls, path: str) -> "LinkProfile":
+        """Reads a profile from a JSON object of fields."""
+        with open(path) as handle:
+            return cls(**json.load(handle))
+
+    def as_dict(self) -> dict:
+        """Returns the profile's fields as a plain dict."""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class Link:
+    """
+    A point-to-point link between two peers of the wire.  Packets in flight
+    either way share one buffer, kept as a FIFO queue of
+    (due time, data, destination) handles.  Every packet is serialized at
+    the link's bandwidth and then delayed by the same amount, so they leave
+    the buffer in the order they were queued; jitter and reordering are
+    applied after that.
+    """
+
+    def __init__(self, name: bytes, profile: LinkProfile, number: int):
+        self.name = name
+        self.ends = []  # addresses of the (up to two) peers
+        self.queue = collections.deque()
+        self.timer = None  # drains the queue when its head falls due
+        self._profile = profile
+        seed = None
+        if profile.seed is not None:
+            seed = "{}/{}".format(profile.seed, number)
+        self._rng = random.Random(seed)
+        self._bad = False  # whether in the burst loss state
+        self._idle_at = 0  # when the bottleneck finishes its last packet
+
+    def drops(self, loss: float) -> bool:
+        """Decides whether the next packet is lost, given the wire's loss
+        rate outside of bursts."""
+        profile = self._profile
+        if self._bad:
+            self._bad = self._rng.random() >= profile.burst_exit
+        elif profile.burst_enter > 0:
+            self._bad = self._rng.random() < profile.burst_enter
+        rate = profile.burst_loss if self._bad else loss
+        return rate > 0 and self._rng.random() < rate
+
+    def damage(self, data: bytes) -> bytes:
+        """Returns the packet as it comes out the other end: usually
+        untouched, but with a bit flipped at the profile's `corrupt`
+        rate."""
+        corrupt = self._profile.corrupt
+        if not data or corrupt <= 0 or self._rng.random() >= corrupt:
+            return data
+        bit = self._rng.randrange(len(data) * 8)
+        damaged = bytearray(data)
+        damaged[bit // 8] ^= 1 << (bit % 8)
+        return bytes(damaged)
+
+    def leaves_bottleneck(self, size: int, now: float) -> float:
+        """Returns when a packet of `size` bytes arriving now will have been
+        serialized onto the link."""
+        if not self._profile.bandwidth:
+            return now
+        self._idle_at = (max(self._idle_at, now) +
+                         size / self._profile.bandwidth)
+        return self._idle_at
+
+    def hold(self) -> float:
+        """Returns the extra delay, for jitter and reordering, of a packet
+        leaving the buffer."""
+        profile = self._profile
+        extra = 0.0
+        if profile.jitter > 0:
+            if profile.jitter_dist == "uniform":
+                extra = self._rng.uniform(0, profile.jitter)
+            elif profile.jitter_dist == "normal":
+                extra = abs(self._rng.gauss(0, profile.jitter))
+            else:
+                extra = self._rng.expovariate(1 / profile.jitter)
+        if profile.reorder > 0 and self._rng.random() < profile.reorder:
+            extra += profile.reorder_delay
+        return extra
+
+
 class CrummyWireProtocol(asyncio.DatagramProtocol):
 
-    def __init__(self, loop, loss: float, delay: float, buffer_size: int):
+    def __init__(self, loop, loss: float, delay: float, buffer_size: int,
+                 profile: LinkProfile = None):
         self._loop = loop
         self._loss = loss
         self._delay = delay
         self._buffer_size = buffer_size
-        self._wirebuffer = []
-        self._peer_addrs = set()
+        self._profile = profile if profile is not None else LinkProfile()
+        self._num_links = 0
+        self._routes = {}  # peer address -> (link, address of other end)
+        self._links = {}  # peer address -> link
+        self._waiting = {}  # link name -> link with only one end so far
         self._transport = None
         self._logger = homework5.logging.get_logger("hw5-wire")
 
@@ -42,71 +206,136 @@ class CrummyWireProtocol(asyncio.DatagramProtocol):
         self._transport = transport
 
     def datagram_received(self, data, addr):
-        self._logger.info(" --> Received %d bytes from %s - %s", len(data),
-                          addr, data_rep(data))
+        self._logger.debug(" --> Received %d bytes from %s - %s", len(data),
+                           addr, LazyDataRep(data))
+
+        if data == CONNECT or data.startswith(CONNECT + b' '):
+            self._connect(addr, data[len(CONNECT) + 1:])
+            return
+        if addr not in self._links:
+            self._connect(addr, b'')
 
-        self._peer_addrs.add(addr)
-        if data == b'connect':
+        route = self._routes.get(addr)
+        if route is None:
+            self._logger.debug(" !-> Dropping, no peer on the link yet")
             return
+        link, peer_addr = route
 
         # First, see if the buffer is full.  If it is, then just drop
         # the packet and pretend nothing happened.
-        if len(self._wirebuffer) == self._buffer_size:
+        if len(link.queue) >= self._buffer_size:
             self._logger.debug(" !-> Dropping, buffer is full")
             return
 
         # Second, see if we should drop the packet.  If so, then we just
         # discard it as if nothing ever happened.
-        if self._loss > 0 and random.random() < self._loss:
+        if link.drops(self._loss):
             self._logger.debug(" !-> Dropping to simulate a lossy connection")
             return
 
+        damaged = link.damage(data)
+        if damaged is not data:
+            self._logger.debug(" ~-> Flipping a bit to simulate corruption")
+            data = damaged
+
         self._logger.debug(" --> Added %d bytes to send in %f seconds",
                            len(data), self._delay)
 
-        # And now, schedule the data to actually be sent in the future.
-        self._wirebuffer.append(data)
-        self._loop.call_later(self._delay, self.send_to_peer_addrs, (data, addr))
+        # And now, queue the data to actually be sent in the future.
+        due = (link.leaves_bottleneck(len(data), self._loop.time()) +
+               self._delay)
+        link.queue.append((due, data, peer_addr))
+        if link.timer is None:
+            link.timer = self._loop.call_at(due, self._drain, link)
 
-    def send_to_peer_addrs(self, package):
-        data, sender_addr = package
+    def _connect(self, addr, name: bytes):
+        """Pairs a newly connected peer with the one waiting on the same
+        link name, or leaves it waiting for one.  A peer that connects again
+        under another name (because its first connect was lost, and its data
+        paired it as an unnamed peer instead) is moved to the named link."""
+        current = self._links.get(addr)
+        if current is not None:
+            if current.name == name:
+                return
+            self._disconnect(addr, current)
+        link = self._waiting.pop(name, None)
+        if link is None:
+            link = Link(name, self._profile, self._num_links)
+            self._waiting[name] = link
+            self._num_links += 1
+        link.ends.append(addr)
+        self._links[addr] = link
+        if len(link.ends) == 2:
+            first, second = link.ends
+            self._routes[first] = link, second
+            self._routes[second] = link, first
+            self._logger.info(" <-> Linked %s and %s", first, second)
 
-        if data not in self._wirebuffer:
-            self._logger.error(" !!! Was scheduled to send data that is not "
-                               "in the write buffer")
-            return
+    def _disconnect(self, addr, link: Link):
+        """Takes a peer off its link, and sends the peer it was paired with
+        (if any) back to wait for another."""
+        del self._links[addr]
+        self._routes.pop(addr, None)
+        link.ends.remove(addr)
+        link.queue.clear()
+        if self._waiting.get(link.name) is link:
+            del self._waiting[link.name]
+        for other in link.ends:
+            del self._links[other]
+            del self._routes[other]
+            self._connect(other, link.name)
 
-        for a_peer_addr in self._peer_addrs:
-            if a_peer_addr == sender_addr:
-                continue
-            self._logger.debug(" <-- Sending %d bytes to %s - %s", len(data),
-                               a_peer_addr, data_rep(data))
-            self._transport.sendto(data, addr=a_peer_addr)
+    def _drain(self, link: Link):
+        """Sends every packet on the link whose delay has passed, and waits
+        for the next one."""
+        now = self._loop.time()
+        queue = link.queue
+        while queue and queue[0][0] <= now:
+            _, data, peer_addr = queue.popleft()
+            hold = link.hold()
+            if hold > 0:
+                self._loop.call_later(hold, self._send, data, peer_addr)
+            else:
+                self._send(data, peer_addr)
+        link.timer = None
+        if queue:
+            link.timer = self._loop.call_at(queue[0][0], self._drain, link)
 
-        self._wirebuffer.remove(data)
+    def _send(self, data: bytes, peer_addr):
+        # packets held back for jitter can fall due after the wire is closed
+        if self._transport.is_closing():
+            return
+        self._logger.debug(" <-- Sending %d bytes to %s - %s", len(data),
+                           peer_addr, LazyDataRep(data))
+        self._transport.sendto(data, addr=peer_addr)
 
 
-def bad_socket(port: int) -> socket.socket:
+def bad_socket(port: int, link: str = None) -> socket.socket:
     """Establishes a connection to the server, that simulates a crummy
     network, on the given port.
 
     Args:
         port -- the port to listen to the service simulating a lossy network.
+        link -- the name of the link to join, when one server simulates
+                several; the socket is connected to the other peer that
+                joins the same link.  If not given, it is paired with
+                whichever other unnamed peer connects before or after it.
 
     Return:
         socket instance, connected and ready to communicate on.
     """
     lossy_socket = socket.socket(type=socket.SOCK_DGRAM)
     lossy_socket.connect(('127.0.0.1', port))
-    lossy_socket.send(b'connect')
+    lossy_socket.send(connect_message(link))
     return lossy_socket
 
 
-def create_server(port: int, loss: float, delay: float, buff_size: int) -> tuple:
+def create_server(port: int, loss: float, delay: float, buff_size: int,
+                  profile: LinkProfile = None) -> tuple:
 
     loop = asyncio.get_event_loop()
     listen = loop.create_datagram_endpoint(
-        lambda: CrummyWireProtocol(loop, loss, delay, buff_size),
+        lambda: CrummyWireProtocol(loop, loss, delay, buff_size, profile),
         local_addr=('127.0.0.1', port))
     transport, _ = loop.run_until_complete(listen)
     return transport, loop
@@ -6,11 +6,1160 @@ be modified.
 import socket
 import io
 import time
+import struct
+import heapq
+import functools
+import select
+import selectors
+import enum
+import collections
+import bisect
+import json
+import csv
+import itertools
+import zlib
+import lzma
 import homework5
 import homework5.logging
 
 
-def send(sock: socket.socket, data: bytes):
+class PacketKind(enum.IntEnum):
+    """
+    The first byte of every packet after its checksum, saying what it is.
+    """
+    DATA = 0
+    # end of the data; takes up a segment number of its own, so it is acked
+    # (the FIN-ACK) and resent exactly like data.  Its payload is how long
+    # the sender may go on resending it (see FIN_WAIT) rather than data.
+    FIN = 1
+    # the sender's acknowledgement of the FIN-ACK, after which the receiver
+    # can stop listening for resent FINs
+    CLOSE = 2
+    # end of one stream of a multiplexed transfer (see `send_streams`);
+    # numbered like data, so it reaches the receiver in order
+    END = 3
+    # XOR of a group of segments, sent in FEC mode so the receiver can
+    # rebuild one lost segment per group without waiting for a resend.  The
+    # header's segment number is the group's first segment, and its stream
+    # field the number of segments in the group.  Parity is never resent.
+    PARITY = 4
+    # sent as segment 0 when the streams are compressed, naming the codec
+    # (see `CODECS`) the receiver should decompress them with.  Nothing
+    # follows it until it is acked, so the receiver can still refuse it.
+    HELLO = 5
+    # sent by the receiver, for every packet of the sender's that it takes
+    ACK = 6
+    # an ack from a receiver that refused the codec named in the HELLO,
+    # which has the sender send its streams uncompressed instead
+    REFUSE = 7
+
+
+# Kinds of packet the receiver sends back; anything else comes from a sender.
+ACK_KINDS = frozenset([PacketKind.ACK, PacketKind.REFUSE])
+SENDER_KINDS = frozenset(PacketKind) - ACK_KINDS
+
+
+# Every packet, either way, starts with a CRC-32 of everything after it (see
+# `seal`), so that packets damaged on the wire are dropped, and resent like
+# any other lost packet, instead of being delivered.
+CHECKSUM = struct.Struct("!I")
+
+# Packets from the sender then carry their kind, the stream the payload
+# belongs to, a 4 byte, big endian segment number, a timestamp (see
+# `timestamp`) and the length of the payload that follows.  Segment numbers
+# count chunks (not bytes) across all streams, so every stream shares one
+# window, one RTT estimate and one close.
+DATA_HEADER = struct.Struct("!IBHIIH")
+
+# Parity covers each segment's kind, stream and payload length as well as
+# its payload (zero padded to a full chunk), so a rebuilt segment comes back
+# complete.
+PARITY_META = struct.Struct("!BHH")
+
+# size of payload after subtracting MAX_PACKET (1400 bytes) by header size,
+# leaving room for a parity packet to carry PARITY_META as well
+CHUNK_SIZE = homework5.MAX_PACKET - DATA_HEADER.size - PARITY_META.size
+PARITY_SIZE = PARITY_META.size + CHUNK_SIZE
+
+# After the checksum, acks carry their kind, the segment number that
+# triggered the ack, the cumulative ack (the next segment the receiver
+# expects, so everything before it has been delivered) and the timestamp of
+# the packet that triggered the ack, echoed back so the sender can take an
+# RTT sample from every ack, even for resent segments.  They are followed by
+# up to MAX_SACK_BLOCKS [start, end) ranges of segments received out of
+# order.
+ACK_HEADER = struct.Struct("!IBIII")
+SACK_BLOCK = struct.Struct("!II")
+MAX_SACK_BLOCKS = 16
+
+# Trigger of an ack sent because a segment was rebuilt from parity, rather
+# than because a packet arrived.
+RECOVERED_TRIGGER = 0xFFFFFFFF
+
+# Upper bound on the number of unacknowledged segments the sender may have in
+# flight.  The congestion window decides how much of this is actually used.
+DEFAULT_WINDOW = 256
+
+# Segments further than this beyond the cumulative ack are dropped by the
+# receiver, so that a confused sender can't make it buffer without bound.
+RECV_WINDOW = 4096
+
+# The receiver writes in order data to its destination in blocks of this many
+# bytes, or after it has waited this many seconds, whichever comes first.
+DEFAULT_FLUSH_SIZE = 1 << 20
+DEFAULT_FLUSH_INTERVAL = 0.1
+
+# Once the FIN is all the sender has left unacked, it is resent at most this
+# many times.  If no FIN-ACK comes back even then, the sender finishes
+# anyway: everything before the FIN was acked, so the receiver has all of the
+# data, and it gives up waiting for the CLOSE on its own.
+FIN_RETRIES = 6
+
+# How long the receiver waits for the sender's CLOSE after acking the FIN,
+# in case it or the FIN-ACK was lost and the FIN is resent.  Every FIN
+# carries, in milliseconds, how long the sender may still go on resending
+# it: a (backed off) timeout for each resend it has left, and one more for
+# the last to arrive.  The receiver waits at least that long after each FIN,
+# so it is still there to ack whichever one gets through.
+DEFAULT_LINGER = 2.0
+FIN_WAIT = struct.Struct("!I")
+
+# Nothing acks the CLOSE, so the sender sends this many copies of it, to
+# spare the receiver that long wait when one is lost.
+CLOSE_COPIES = 3
+
+# Most datagrams `BatchedSocket` reads in one pass.
+RECV_BATCH = 64
+
+# Acks detect losses by time, in the manner of RACK (RFC 8985), so that
+# packets the wire reorders aren't taken for lost: a segment is lost once a
+# segment sent after it has been delivered, and it has had that segment's
+# RTT plus a reordering window to arrive itself.  The window starts at this
+# fraction of the minimum RTT, and doubles each time a segment taken for
+# lost turns out to have arrived after all, up to the smoothed RTT.
+REORDER_FRACTION = 0.25
+
+# Bounds on the retransmission timeout, in seconds, and its value until
+# there is an RTT sample.  Each timeout of a resent segment doubles it until
+# the next RTT sample sets it afresh, but never past BACKOFF_RTTS smoothed
+# RTTs (or the timeout from the last sample, if that is longer), nor past
+# MAX_RTO: every ack gives an RTT sample here, so waiting longer than a couple
+# of RTTs for one gains nothing on a lossy link.
+MIN_RTO = 0.005
+MAX_RTO = 3.0
+INITIAL_RTO = 1.0
+BACKOFF_RTTS = 2
+
+# The longest a FIN can have the receiver linger (see FIN_WAIT), for a
+# sender whose timeout is backed off as far as it goes.
+MAX_FIN_WAIT = (FIN_RETRIES + 1) * MAX_RTO
+
+# In FEC mode, the sender sends a parity packet for every group of this many
+# new segments, picking the size so that a group expects to lose about
+# FEC_TARGET_LOSSES segments at the loss rate it currently sees.
+FEC_MIN_GROUP = 2
+FEC_MAX_GROUP = 32
+FEC_TARGET_LOSSES = 0.5
+FEC_INITIAL_LOSS = 0.05
+FEC_LOSS_GAIN = 1 / 32  # weight of each new sample in the loss rate EWMA
+
+# Number of recent segments the receiver keeps parity blocks for.
+FEC_CACHE = 1024
+
+# Compression codecs the sender can offer, by the name sent in its HELLO.
+Codec = collections.namedtuple("Codec", "compressor decompressor")
+CODECS = {
+    "zlib": Codec(zlib.compressobj, zlib.decompressobj),
+    "lzma": Codec(lzma.LZMACompressor, lzma.LZMADecompressor),
+}
+
+# With compression on, the start of each stream is test compressed, and the
+# stream is sent uncompressed unless that saves at least 10%.
+COMPRESSION_PROBE = 1 << 16
+COMPRESSIBLE_RATIO = 0.9
+# Size of the reads fed to the compressor.
+COMPRESSION_READ = 1 << 16
+
+
+class TransferStats:
+    """
+    Counters describing how a transfer went, filled in by whichever sender
+    or receiver it is handed to.  Most count what their names say; a few
+    need spelling out, since losses are detected by time rather than by
+    duplicate acks (see REORDER_FRACTION).
+
+    Fields:
+        fast_retransmits -- Times the sender entered fast recovery, because
+                            acks showed segments lost (each time may resend
+                            several of them), rather than a timeout.
+        duplicate_acks -- Acks that didn't move the cumulative ack forward.
+                          Only counted: they play no part in loss detection.
+        duplicates -- Segments the receiver got more than once.
+    """
+
+    FIELDS = ("segments_sent", "retransmits", "timeouts", "fast_retransmits",
+              "duplicate_acks", "parity_sent", "parity_received",
+              "fec_recoveries", "bytes_sent", "duplicates", "bytes_delivered",
+              "corrupted")
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def as_dict(self) -> dict:
+        """Returns the counters as a plain dict."""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def write_json(self, path: str):
+        """Writes the counters to a file, as a JSON object."""
+        with open(path, "w") as handle:
+            json.dump(self.as_dict(), handle)
+
+    # Called by the sender and receiver for every event of the transfer.
+    # Counters are all most callers need, so these do nothing here; see
+    # `Telemetry` for a version that records them.
+
+    def on_send(self, now: float, seq: int, resent: bool):
+        """A data segment was sent (or resent)."""
+
+    def on_ack(self, now: float, trigger: int, cumulative: int,
+               cwnd: float, ssthresh: float):
+        """An ack was processed, leaving the window as given."""
+
+    def on_rtt(self, now: float, sample: float, estimated_rtt: float,
+               dev_rtt: float, timeout_interval: float):
+        """An RTT sample was taken, updating the timeout as given."""
+
+    def on_timeout(self, now: float, expired: int):
+        """The retransmission timer expired for `expired` segments."""
+
+    def on_receive(self, now: float, seq: int, kind: int, duplicate: bool):
+        """The receiver got a packet."""
+
+
+class Telemetry(TransferStats):
+    """
+    TransferStats that also keeps a timeline of every event of the
+    transfer, for seeing where the time went: when each segment was sent
+    and acked, each RTT sample with the estimates and timeout it led to,
+    the congestion window after each ack, and timeouts.
+
+    Times are in seconds since the first event.  The timeline can be
+    written out as JSON or as CSV, one row per event with the columns in
+    `COLUMNS`.
+    """
+
+    COLUMNS = ("time", "event", "seq", "resent", "trigger", "cumulative",
+               "cwnd", "ssthresh", "sample", "estimated_rtt", "dev_rtt",
+               "timeout_interval", "expired", "kind", "duplicate")
+
+    def __init__(self):
+        super().__init__()
+        self.timeline = []
+        self._start = None
+
+    def _record(self, now: float, event: str, **fields):
+        if self._start is None:
+            self._start = now
+        fields["time"] = round(now - self._start, 6)
+        fields["event"] = event
+        self.timeline.append(fields)
+
+    def on_send(self, now, seq, resent):
+        self._record(now, "send", seq=seq, resent=resent)
+
+    def on_ack(self, now, trigger, cumulative, cwnd, ssthresh):
+        self._record(now, "ack", trigger=trigger, cumulative=cumulative,
+                     cwnd=cwnd, ssthresh=ssthresh)
+
+    def on_rtt(self, now, sample, estimated_rtt, dev_rtt, timeout_interval):
+        self._record(now, "rtt", sample=sample, estimated_rtt=estimated_rtt,
+                     dev_rtt=dev_rtt, timeout_interval=timeout_interval)
+
+    def on_timeout(self, now, expired):
+        self._record(now, "timeout", expired=expired)
+
+    def on_receive(self, now, seq, kind, duplicate):
+        self._record(now, "receive", seq=seq, kind=kind, duplicate=duplicate)
+
+    def events(self, event: str) -> list:
+        """Returns the timeline rows of one kind of event."""
+        return [row for row in self.timeline if row["event"] == event]
+
+    def write_timeline(self, path: str):
+        """Writes the timeline to a file, as CSV if `path` ends in .csv, and
+        otherwise as JSON (along with the counters)."""
+        with open(path, "w", newline="") as handle:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(handle, fieldnames=self.COLUMNS)
+                writer.writeheader()
+                writer.writerows(self.timeline)
+            else:
+                json.dump(dict(self.as_dict(), timeline=self.timeline),
+                          handle)
+
+
+class CongestionWindow:
+    """
+    TCP Reno style congestion window, counted in segments.
+
+    The window starts at one segment and grows by a segment per acked segment
+    (slow start) until it reaches `ssthresh`, and by a segment per window
+    after that (congestion avoidance).  A loss detected from acks halves it
+    and enters fast recovery, where lost segments are resent without waiting
+    for a timeout; a timeout drops it back to a single segment.
+    """
+
+    def __init__(self, max_window: int):
+        self.max_window = max_window
+        self.cwnd = 1.0
+        self.ssthresh = float(max_window)
+        # highest segment sent when recovery started; recovery ends once the
+        # receiver has everything up to it
+        self.recover = None
+        # the window before the last cut, until it is undone
+        self._prior = None
+
+    def __int__(self):
+        return max(1, min(int(self.cwnd), self.max_window))
+
+    @property
+    def in_recovery(self) -> bool:
+        """Whether the window is currently in fast recovery."""
+        return self.recover is not None
+
+    def on_ack(self, newly_acked: int, cumulative: int):
+        """Grows the window for segments that were acked for the first time,
+        and leaves fast recovery once everything up to the recovery point
+        has been acked.
+        """
+        if self.in_recovery:
+            if cumulative > self.recover:
+                self.recover = None
+                self.cwnd = self.ssthresh
+            return
+        for _ in range(newly_acked):
+            if self.cwnd < self.ssthresh:
+                self.cwnd += 1
+            else:
+                self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_fast_retransmit(self, flight_size: int, highest_sent: int):
+        """Halves the window and enters fast recovery."""
+        self._prior = self.cwnd, self.ssthresh
+        self.ssthresh = max(flight_size / 2, 2.0)
+        self.cwnd = self.ssthresh
+        self.recover = highest_sent
+
+    def on_timeout(self, flight_size: int):
+        """Collapses the window after a retransmission timeout."""
+        if not self.in_recovery:
+            self._prior = self.cwnd, self.ssthresh
+        self.ssthresh = max(flight_size / 2, 2.0)
+        self.cwnd = 1.0
+        self.recover = None
+
+    def undo(self):
+        """Takes back the last cut of the window, once the losses that
+        caused it have turned out to be reordering or delay."""
+        if self._prior is None:
+            return
+        cwnd, ssthresh = self._prior
+        self.cwnd = max(self.cwnd, cwnd)
+        self.ssthresh = max(self.ssthresh, ssthresh)
+        self.recover = None
+        self._prior = None
+
+
+def timestamp(now: float) -> int:
+    """Encodes a time for a header's timestamp field, as microseconds
+    wrapping around at 32 bits."""
+    return int(now * 1000000) & 0xFFFFFFFF
+
+
+def since(echo: int, now: float) -> float:
+    """Returns how long ago, in seconds, an echoed timestamp was taken."""
+    return ((timestamp(now) - echo) & 0xFFFFFFFF) / 1000000
+
+
+def seal(packet: bytearray):
+    """Fills in the checksum at the front of a packet, in a writable
+    buffer, from the rest of it."""
+    view = memoryview(packet)
+    CHECKSUM.pack_into(view, 0, zlib.crc32(view[CHECKSUM.size:]))
+
+
+def intact(packet: bytes, header: struct.Struct) -> bool:
+    """Whether a packet is long enough for its header, and matches the
+    checksum at its front."""
+    view = memoryview(packet)
+    return (len(view) >= header.size and
+            CHECKSUM.unpack_from(view)[0] == zlib.crc32(view[CHECKSUM.size:]))
+
+
+def buffer_chunks(data: bytes):
+    """Yields CHUNK_SIZE memoryview slices of a bytes-like object, so no
+    payload is copied until it is written into a packet."""
+    view = memoryview(data).cast("B")
+    for offset in range(0, len(view), CHUNK_SIZE):
+        yield view[offset:offset + CHUNK_SIZE]
+
+
+def stream_chunks(readable: io.RawIOBase):
+    """Yields blocks of at most CHUNK_SIZE bytes read from a file object (or
+    anything else with a `read` method, such as an mmap), until it reports
+    EOF by returning an empty block."""
+    return iter(functools.partial(readable.read, CHUNK_SIZE), b"")
+
+
+def _rechunk(blocks):
+    """Cuts an iterable of variable sized blocks into CHUNK_SIZE chunks."""
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer[:CHUNK_SIZE])
+            del buffer[:CHUNK_SIZE]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _compressed_blocks(readable: io.RawIOBase, codec: Codec):
+    probe = readable.read(COMPRESSION_PROBE)
+    if not probe:
+        return
+    rest = iter(functools.partial(readable.read, COMPRESSION_READ), b"")
+    # A fast test compression of the start of the stream is enough to spot
+    # data that is already compressed, without paying for the real codec.
+    if len(zlib.compress(probe, 1)) > COMPRESSIBLE_RATIO * len(probe):
+        yield b"\x00"
+        yield probe
+        yield from rest
+        return
+    compressor = codec.compressor()
+    yield b"\x01"
+    yield compressor.compress(probe)
+    for block in rest:
+        yield compressor.compress(block)
+    yield compressor.flush()
+
+
+def compressed_chunks(readable: io.RawIOBase, codec: Codec):
+    """
+    Like `stream_chunks`, but compresses the data with `codec` on the way.
+    The stream starts with a byte saying whether it was compressed, since
+    data that barely compresses is sent as it is.
+    """
+    return _rechunk(_compressed_blocks(readable, codec))
+
+
+def read_chunks(readable: io.RawIOBase, compression: str = None):
+    """Returns the chunks of a file object, compressed with the named codec
+    if `compression` is given."""
+    if compression is None:
+        return stream_chunks(readable)
+    return compressed_chunks(readable, CODECS[compression])
+
+
+def offer(make_segments, compression: str = None) -> tuple:
+    """
+    Returns the `segments` and `fallback` arguments of a `Sender`, given a
+    function that builds the segments of the transfer for a codec name (or
+    None, for no compression).
+
+    With compression, the segments start with a HELLO naming the codec, and
+    the fallback is the uncompressed segments, which are sent instead if
+    the receiver refuses the codec.  Segments are only read as the sender
+    takes them, so whichever goes unused costs nothing.
+    """
+    if compression is None:
+        return make_segments(None), None
+    hello = PacketKind.HELLO, 0, compression.encode("ascii")
+    return (itertools.chain([hello], make_segments(compression)),
+            make_segments(None))
+
+
+class StreamDecompressor:
+    """
+    Undoes `compressed_chunks` for one stream, a block at a time, picking
+    up from the stream's first byte whether it was compressed at all.
+    """
+
+    def __init__(self, codec: Codec):
+        self._codec = codec
+        self._decompressor = None
+        self._started = False
+
+    def decompress(self, data: bytes) -> bytes:
+        """Returns the data that the next block of the stream decodes to."""
+        if not self._started:
+            if not data:
+                return b""
+            self._started = True
+            if data[0]:
+                self._decompressor = self._codec.decompressor()
+            data = data[1:]
+        if self._decompressor is None:
+            return data
+        return self._decompressor.decompress(data)
+
+    def flush(self) -> bytes:
+        """Returns whatever the decompressor still holds at the end of the
+        stream."""
+        # zlib holds back output until flushed; lzma never does, and has
+        # no flush method
+        flush = getattr(self._decompressor, "flush", None)
+        return flush() if flush is not None else b""
+
+
+def single_stream(chunks):
+    """Labels every chunk as data on stream 0, for unmultiplexed transfers."""
+    for chunk in chunks:
+        yield PacketKind.DATA, 0, chunk
+
+
+def interleave_streams(streams: list):
+    """
+    Takes one chunk at a time from each of a list of chunk iterators in
+    turn, so every stream gets an equal share of the window, and labels it
+    with the stream's index in the list.  Once a stream runs dry, an END
+    segment for it is yielded in place of its next chunk.
+    """
+    active = collections.deque(enumerate(iter(chunks) for chunks in streams))
+    while active:
+        stream_id, chunks = active.popleft()
+        chunk = next(chunks, None)
+        if chunk is None:
+            yield PacketKind.END, stream_id, b""
+            continue
+        yield PacketKind.DATA, stream_id, chunk
+        active.append((stream_id, chunks))
+
+
+def parity_block(kind: PacketKind, stream: int, payload: bytes) -> int:
+    """Returns a segment's contribution to a parity packet, as an integer so
+    blocks can be XORed together a whole packet at a time."""
+    meta = PARITY_META.pack(kind, stream, len(payload))
+    padding = 8 * (CHUNK_SIZE - len(payload))
+    return (int.from_bytes(meta, "big") << (8 * CHUNK_SIZE) |
+            int.from_bytes(payload, "big") << padding)
+
+
+class ParityEncoder:
+    """
+    The sender's half of FEC mode: XORs each group of consecutive new
+    segments into a parity packet, with a group size that follows the loss
+    rate the sender observes.
+    """
+
+    def __init__(self):
+        self.loss_rate = FEC_INITIAL_LOSS
+        self._first = 0  # first segment of the open group
+        self._count = 0  # segments in the open group so far
+        self._size = self.group_size()  # segments the open group will hold
+        self._parity = 0
+        self._group_ends = []  # end of every closed group, ascending
+
+    def group_size(self) -> int:
+        """The group size to use at the current loss rate."""
+        size = int(FEC_TARGET_LOSSES / max(self.loss_rate, 1e-6))
+        return max(FEC_MIN_GROUP, min(FEC_MAX_GROUP, size))
+
+    def on_outcome(self, lost: bool):
+        """Feeds whether a segment was lost into the loss rate estimate."""
+        self.loss_rate += FEC_LOSS_GAIN * (lost - self.loss_rate)
+
+    def add(self, seq: int, kind: PacketKind, stream: int, payload: bytes,
+            now: float) -> bytes:
+        """Adds a newly sent segment to the open group, and returns the
+        group's parity packet, stamped with `now`, if that filled it
+        (otherwise None)."""
+        if not self._count:
+            self._first = seq
+        self._count += 1
+        self._parity ^= parity_block(kind, stream, payload)
+        if self._count < self._size:
+            return None
+        return self.close(now)
+
+    def close(self, now: float) -> bytes:
+        """Closes the open group early (at the end of the data), returning
+        its parity packet, or None if the group is empty."""
+        if not self._count:
+            return None
+        packet = bytearray(DATA_HEADER.pack(0, PacketKind.PARITY,
+                                            self._count, self._first,
+                                            timestamp(now), PARITY_SIZE))
+        packet += self._parity.to_bytes(PARITY_SIZE, "big")
+        seal(packet)
+        self._group_ends.append(self._first + self._count)
+        self._count = 0
+        self._parity = 0
+        self._size = self.group_size()
+        return packet
+
+    def may_recover(self, seq: int, trigger: int) -> bool:
+        """
+        Whether the receiver might still rebuild `seq` from parity, given an
+        ack triggered by segment `trigger`.  That holds while its group is
+        open, and until an ack shows the receiver has seen a segment sent
+        after the group's parity.
+        """
+        if not self._group_ends or seq >= self._group_ends[-1]:
+            return True
+        end = self._group_ends[bisect.bisect_right(self._group_ends, seq)]
+        return trigger < end
+
+    def forget_before(self, seq: int):
+        """Drops the bookkeeping for groups that end at or before `seq`."""
+        del self._group_ends[:bisect.bisect_right(self._group_ends, seq)]
+
+
+class ParityDecoder:
+    """
+    The receiver's half of FEC mode: remembers recent segments, and rebuilds
+    the one missing segment of a group from its parity packet.  The receiver
+    can't know a transfer uses FEC until the first parity packet arrives, so
+    segments are only kept from then on, and transfers without FEC pay
+    nothing for it; the price is that the first group can't be rebuilt.
+    Kept segments are only XORed together when a parity packet needs them.
+    """
+
+    def __init__(self):
+        self._segments = {}  # segment number -> (kind, stream, payload)
+        self._seen_parity = False
+
+    def add(self, seq: int, kind: PacketKind, stream: int, payload: bytes):
+        """Remembers a newly arrived segment, once the transfer is known to
+        use FEC."""
+        if not self._seen_parity:
+            return
+        self._segments[seq] = kind, stream, bytes(payload)
+        if len(self._segments) > FEC_CACHE:
+            del self._segments[next(iter(self._segments))]
+
+    def recover(self, first: int, count: int, parity: bytes, received):
+        """
+        Rebuilds the missing segment of the group of `count` segments
+        starting at `first`, if exactly one of them is missing.
+
+        Args:
+            received -- Called with a segment number, returns whether that
+                        segment has already arrived.
+
+        Return:
+            The rebuilt segment as (seq, kind, stream, payload), or None.
+        """
+        self._seen_parity = True
+        missing = [seq for seq in range(first, first + count)
+                   if seq not in self._segments]
+        if len(missing) != 1 or received(missing[0]):
+            return None
+        block = int.from_bytes(parity, "big")
+        for seq in range(first, first + count):
+            if seq != missing[0]:
+                block ^= parity_block(*self._segments[seq])
+        block = block.to_bytes(PARITY_SIZE, "big")
+        kind, stream, size = PARITY_META.unpack_from(block)
+        payload = block[PARITY_META.size:PARITY_META.size + size]
+        return missing[0], PacketKind(kind), stream, payload
+
+
+class Sender:
+    """
+    The sending half of the protocol, kept separate from any socket so the
+    same state machine can be driven by different I/O loops.
+
+    Payload comes from an iterator of (kind, stream, chunk) tuples (see
+    `single_stream` and `interleave_streams`), which is only advanced when
+    the window has room for a new segment, and a chunk is only kept until
+    its segment is acked.  Chunks are numbered as segments, which are kept
+    in flight according to a congestion window (see `CongestionWindow`),
+    capped at `window` segments.  Each segment has its own retransmission
+    timer, and acks report both the cumulative progress of the receiver and
+    the out of order segments it is holding, so only segments that were
+    actually lost are resent.  A segment counts as lost once a segment sent
+    after it has been acked and it has had a reordering window to arrive
+    itself (see REORDER_FRACTION), not after a number of duplicate acks,
+    so reordering doesn't set off resends.  Nothing here sleeps: packets
+    leave as fast as acks open the window, and the only waiting is for the
+    next retransmission deadline.
+
+    With `fec` set, a parity packet follows every group of new segments
+    (see `ParityEncoder`), and a segment is only treated as lost by acks
+    once the receiver has had the chance to rebuild it from its parity.
+
+    A HELLO segment is sent on its own, and if the receiver refuses the
+    codec it names, the rest of the transfer comes from `fallback` instead
+    (see `offer`).
+    """
+
+    def __init__(self, segments, window: int = DEFAULT_WINDOW,
+                 fec: bool = False, stats: TransferStats = None,
+                 fallback=None):
+        self._logger = homework5.logging.get_logger("hw5-sender")
+        self.stats = stats if stats is not None else TransferStats()
+        self._parity = ParityEncoder() if fec else None
+
+        self._segments = iter(segments)
+        self._fallback = fallback
+        self._exhausted = False  # whether the last chunk has been taken
+        # segment number of the HELLO, until the receiver has answered it
+        self._hello = None
+        # segment number -> (kind, stream, payload), for every segment not
+        # yet acked
+        self._payloads = {}
+        self._window = window
+
+        # Every packet is assembled in this one buffer and handed to the
+        # socket as a view, rather than concatenating header and payload.
+        self._packet = bytearray(homework5.MAX_PACKET)
+        self._packet_view = memoryview(self._packet)
+
+        self.alpha = 0.125  # typical value for calculating estimated_rtt
+        self.beta = 0.25  # typical value for calculating dev_rtt
+
+        # initial values
+        self.estimated_rtt = 0
+        self.dev_rtt = 0
+        self.timeout_interval = INITIAL_RTO
+        self._sampled_timeout = INITIAL_RTO  # before any backing off
+        self._first_sample = True
+
+        self.congestion = CongestionWindow(window)
+
+        # segment number -> time last sent, for every segment that is
+        # currently on the wire.  Segments are (re)inserted when they are
+        # sent, so the dict is ordered by send time.
+        self._in_flight = {}
+        # segments that were detected as lost, and are waiting to be resent,
+        # as a heap so the oldest is always resent first
+        self._lost = []
+        self._lost_set = set()
+        # segments that have been resent after a timeout, and not acked since
+        self._timed_out = set()
+        self.base = 0  # oldest segment not yet cumulatively acked
+        self.next_seq = 0  # next segment that has never been sent
+        self._fin_retries = 0  # resends of the FIN alone (see FIN_RETRIES)
+        self._gave_up = False  # whether the FIN-ACK never came
+
+        # Loss detection (see REORDER_FRACTION): when the latest transmission
+        # known to have arrived was sent, and its RTT
+        self._delivered_sent = None
+        self._delivered_rtt = 0.0
+        self.min_rtt = None
+        self._reorder_mult = 1  # reordering window, in REORDER_FRACTIONs
+        self._reordered = False  # whether the current ack showed reordering
+        # segments the current fast recovery or timeout took for lost, less
+        # those that arrived after all
+        self._recovery_lost = set()
+        # when the oldest segment still inside the reordering window can be
+        # taken for lost, if nothing arrives before then
+        self._reorder_deadline = None
+        self._last_trigger = 0  # trigger of the latest ack
+
+    @property
+    def finished(self) -> bool:
+        """Whether all of the data, and the FIN after it, has been sent and
+        acknowledged (or the FIN resent FIN_RETRIES times without an ack)."""
+        return self._exhausted and (self.base >= self.next_seq or
+                                    self._gave_up)
+
+    def close_packet(self) -> bytes:
+        """The packet that acknowledges the receiver's FIN-ACK, which the
+        sender sends (CLOSE_COPIES times, as nothing acks it) before it
+        returns."""
+        packet = bytearray(DATA_HEADER.pack(0, PacketKind.CLOSE, 0,
+                                            self.next_seq, 0, 0))
+        seal(packet)
+        return packet
+
+    def _packet_for(self, seq: int, now: float) -> memoryview:
+        kind, stream, chunk = self._payloads[seq]
+        if kind == PacketKind.FIN:
+            chunk = FIN_WAIT.pack(round(self._fin_wait() * 1000))
+        end = DATA_HEADER.size + len(chunk)
+        DATA_HEADER.pack_into(self._packet, 0, 0, kind, stream, seq,
+                              timestamp(now), len(chunk))
+        self._packet[DATA_HEADER.size:end] = chunk
+        packet = self._packet_view[:end]
+        seal(packet)
+        self.stats.bytes_sent += end
+        return packet
+
+    def _max_timeout(self) -> float:
+        return min(max(self._sampled_timeout,
+                       BACKOFF_RTTS * self.estimated_rtt), MAX_RTO)
+
+    def _fin_wait(self) -> float:
+        return (FIN_RETRIES - self._fin_retries + 1) * self._max_timeout()
+
+    def _mark_lost(self, seq: int):
+        del self._in_flight[seq]
+        self._lost_set.add(seq)
+        heapq.heappush(self._lost, seq)
+        if self._parity is not None:
+            self._parity.on_outcome(True)
+
+    def _acked(self, seq: int) -> bool:
+        if seq in self._lost_set:
+            # taken for lost, but it arrived before it was even resent
+            self._needless(seq)
+        self._lost_set.discard(seq)
+        self._timed_out.discard(seq)
+        self._payloads.pop(seq, None)
+        if self._in_flight.pop(seq, None) is None:
+            return False
+        if self._parity is not None:
+            self._parity.on_outcome(False)
+        return True
+
+    def _may_recover(self, seq: int, trigger: int) -> bool:
+        return self._parity is not None and self._parity.may_recover(seq,
+                                                                     trigger)
+
+    def packets(self, now: float):
+        """
+        Yields the packets that the window allows to be sent right now,
+        resending lost segments (oldest first) before anything new.
+
+        Each packet is a view into a buffer that is reused for the next one,
+        so it must be sent before the generator is advanced.
+        """
+        while len(self._in_flight) < int(self.congestion):
+            if self._lost_set:
+                seq = heapq.heappop(self._lost)
+                if seq not in self._lost_set:
+                    continue
+                self._lost_set.remove(seq)
+                self._logger.debug("Resending segment %d", seq)
+                self._in_flight[seq] = now
+                self.stats.retransmits += 1
+                self.stats.on_send(now, seq, True)
+                yield self._packet_for(seq, now)
+            elif (not self._exhausted and self._hello is None and
+                  self.next_seq - self.base < self._window):
+                segment = next(self._segments, None)
+                seq = self.next_seq
+                if segment is None:
+                    # out of data, so what would have been the next segment
+                    # becomes the FIN
+                    self._exhausted = True
+                    segment = PacketKind.FIN, 0, b""
+                elif segment[0] == PacketKind.HELLO:
+                    self._hello = seq
+                self._payloads[seq] = segment
+                self._in_flight[seq] = now
+                self.next_seq += 1
+                self.stats.segments_sent += 1
+                self.stats.on_send(now, seq, False)
+                yield self._packet_for(seq, now)
+                if self._parity is not None:
+                    parity = self._parity.add(seq, *segment, now)
+                    if parity is None and self._exhausted:
+                        parity = self._parity.close(now)
+                    if parity is not None:
+                        self.stats.parity_sent += 1
+                        self.stats.bytes_sent += len(parity)
+                        yield parity
+            else:
+                return
+
+    def deadline(self) -> float:
+        """The time at which the oldest segment in flight should be resent,
+        or taken for lost if it waits out the reordering window first, or
+        None if nothing is in flight."""
+        for sent in self._in_flight.values():
+            deadline = sent + self.timeout_interval
+            if self._reorder_deadline is not None:
+                deadline = min(deadline, self._reorder_deadline)
+            return deadline
+        return None
+
+    def on_timeout(self, now: float):
+        """Marks every segment that has waited out the reordering window as
+        lost, then every segment whose timer has expired, collapsing the
+        congestion window if any had."""
+        if (self._reorder_deadline is not None and
+                self._reorder_deadline <= now):
+            self._detect_losses(now, self._last_trigger)
+        expired = []
+        for seq, sent in self._in_flight.items():
+            if sent + self.timeout_interval > now:
+                break
+            expired.append(seq)
+        if not expired:
+            return
+        if self._exhausted and self.base == self.next_seq - 1:
+            # only the FIN is left
+            if self._fin_retries == FIN_RETRIES:
+                self._logger.info("No FIN-ACK after %d resends, giving up",
+                                  FIN_RETRIES)
+                self._gave_up = True
+                self._in_flight.clear()
+                return
+            self._fin_retries += 1
+        self._logger.info("Timeout for ACK, resending %d segments",
+                          len(expired))
+        # Back off only when a resend has timed out as well.  Plain losses
+        # say nothing about whether the timeout suits the path, and at high
+        # loss rates backing off for each of them would mostly add waiting.
+        if not self._timed_out.isdisjoint(expired):
+            self.timeout_interval = min(self.timeout_interval * 2,
+                                        self._max_timeout())
+        self._timed_out.update(expired)
+        self.stats.timeouts += 1
+        self.stats.on_timeout(now, len(expired))
+        # a timeout during fast recovery is part of the same loss episode,
+        # so undoing it means going back to the window from before both
+        if not self.congestion.in_recovery:
+            self._recovery_lost.clear()
+        self._recovery_lost.update(expired)
+        self.congestion.on_timeout(len(self._in_flight))
+        for seq in expired:
+            self._mark_lost(seq)
+
+    def _reorder_window(self) -> float:
+        return min(self._reorder_mult * REORDER_FRACTION * self.min_rtt,
+                   self.estimated_rtt)
+
+    def _needless(self, seq: int):
+        """
+        Notes that segment `seq` arrived after it was taken for lost, so the
+        wire reorders or delays packets more than the sender allowed for.
+        Doubles the reordering window (once per ack, however many segments
+        the ack shows this for), and undoes the last cut of the congestion
+        window once none of the segments that fast recovery or the timeout
+        took for lost were.
+        """
+        if not self._reordered:
+            self._reordered = True
+            self._reorder_mult *= 2
+        if seq in self._recovery_lost:
+            self._recovery_lost.remove(seq)
+            if not self._recovery_lost:
+                self._logger.info("Nothing was lost, undoing the window cut")
+                self.congestion.undo()
+
+    def _detect_losses(self, now: float, trigger: int):
+        """
+        Marks the segments in flight that were sent before the latest one
+        known to have arrived, and have waited out its RTT plus the
+        reordering window since, as lost, entering fast recovery if that
+        finds any.  The first segment still inside the window sets the
+        deadline for looking again.
+        """
+        self._reorder_deadline = None
+        if self._delivered_sent is None:
+            return
+        wait = self._delivered_rtt + self._reorder_window()
+        lost = []
+        for seq, sent in self._in_flight.items():
+            if sent >= self._delivered_sent:
+                break
+            if sent + wait > now:
+                self._reorder_deadline = sent + wait
+                break
+            if not self._may_recover(seq, trigger):
+                lost.append(seq)
+        if not lost:
+            return
+        if not self.congestion.in_recovery:
+            self._logger.info("Fast retransmit of segment %d", lost[0])
+            self.stats.fast_retransmits += 1
+            self.congestion.on_fast_retransmit(len(self._in_flight),
+                                               self.next_seq - 1)
+            self._recovery_lost.clear()
+        self._recovery_lost.update(lost)
+        for seq in lost:
+            self._mark_lost(seq)
+
+    def _sample_rtt(self, sample_rtt: float):
+        if self._first_sample:
+            self._first_sample = False
+            # typical values for the first time calculation
+            self.estimated_rtt = sample_rtt
+            self.dev_rtt = sample_rtt / 2
+        else:
+            self.estimated_rtt = ((1 - self.alpha) * self.estimated_rtt +
+                                  self.alpha * sample_rtt)
+            self.dev_rtt = ((1 - self.beta) * self.dev_rtt +
+                            self.beta * abs(sample_rtt - self.estimated_rtt))
+        if self.min_rtt is None or sample_rtt < self.min_rtt:
+            self.min_rtt = sample_rtt
+        # Like RFC 6298's clock granularity term, never let the variance term
+        # shrink below a fraction of the RTT, or a perfectly steady link
+        # would time out just before the acks that detect losses arrive.
+        self.timeout_interval = self.estimated_rtt + max(
+            4 * self.dev_rtt, self.estimated_rtt / 2)
+        self.timeout_interval = min(max(self.timeout_interval, MIN_RTO),
+                                    MAX_RTO)
+        self._sampled_timeout = self.timeout_interval
+
+    def on_ack(self, ack: bytes, now: float):
+        """Processes an ack packet from the receiver."""
+        if not intact(ack, ACK_HEADER):
+            self._logger.info("Dropping corrupted ack")
+            self.stats.corrupted += 1
+            return
+        _, kind, trigger, cumulative, echo = ACK_HEADER.unpack_from(ack)
+        # A packet that passes the checksum can still be something other
+        # than an ack of this transfer, such as a sender's packet when two
+        # senders are paired up, so never trust it further than it checks
+        # out.
+        if (kind not in ACK_KINDS or
+                (len(ack) - ACK_HEADER.size) % SACK_BLOCK.size or
+                cumulative > self.next_seq):
+            self._logger.info("Dropping a packet that is not an ack of this "
+                              "transfer")
+            return
+        if trigger == RECOVERED_TRIGGER and self._parity is not None:
+            # the receiver rebuilt a segment from parity; it was still lost
+            # as far as the loss rate is concerned
+            self._parity.on_outcome(True)
+        self._logger.debug("Ack trigger:%d cumulative:%d timeout:%.2f "
+                           "cwnd:%.2f", trigger, cumulative,
+                           self.timeout_interval, self.congestion.cwnd)
+
+        # The echoed timestamp says exactly which transmission was acked,
+        # so every ack gives an RTT sample, resent segments included.
+        sample = since(echo, now)
+        self._sample_rtt(sample)
+        self.stats.on_rtt(now, sample, self.estimated_rtt, self.dev_rtt,
+                          self.timeout_interval)
+        self._reordered = False
+        trigger_sent = self._in_flight.get(trigger)
+        if trigger_sent is not None and timestamp(trigger_sent) != echo:
+            # the ack is for an earlier transmission than the segment's
+            # latest, so resending it was needless
+            self._needless(trigger)
+        sent = now - sample
+        if self._delivered_sent is None or sent > self._delivered_sent:
+            self._delivered_sent = sent
+            self._delivered_rtt = sample
+        self._last_trigger = trigger
+
+        # everything before the cumulative ack has been delivered, and
+        # selectively acked segments no longer need to be retransmitted
+        newly_acked = 0
+        if cumulative > self.base:
+            for seq in range(self.base, cumulative):
+                newly_acked += self._acked(seq)
+            self.base = cumulative
+            if self._parity is not None:
+                self._parity.forget_before(cumulative)
+            if self._hello is not None and cumulative > self._hello:
+                self._hello = None
+                if kind == PacketKind.REFUSE:
+                    self._logger.info("Receiver refused the codec, sending "
+                                      "uncompressed")
+                    self._segments = iter(self._fallback)
+        else:
+            self.stats.duplicate_acks += 1
+        for offset in range(ACK_HEADER.size, len(ack), SACK_BLOCK.size):
+            start, end = SACK_BLOCK.unpack_from(ack, offset)
+            for seq in range(max(start, self.base), min(end, self.next_seq)):
+                newly_acked += self._acked(seq)
+        self.congestion.on_ack(newly_acked, self.base)
+        self.stats.on_ack(now, trigger, cumulative, self.congestion.cwnd,
+                          self.congestion.ssthresh)
+
+        self._detect_losses(now, trigger)
+
+
+class BatchedSocket:
+    """
+    Wraps a connected datagram socket so that everything waiting to be read
+    is drained in one pass, into buffers allocated once up front, instead
+    of one blocking `recv` (and a fresh bytes object) per datagram.
+
+    The socket is switched to non-blocking mode while wrapped, and put back
+    the way it was on `close` (or when used as a context manager).
+    """
+
+    def __init__(self, sock: socket.socket, batch_size: int = RECV_BATCH):
+        self._sock = sock
+        self._timeout = sock.gettimeout()
+        sock.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(sock, selectors.EVENT_READ)
+        self._views = [memoryview(bytearray(homework5.MAX_PACKET))
+                       for _ in range(batch_size)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops watching the socket, and restores its timeout."""
+        self._selector.close()
+        self._sock.settimeout(self._timeout)
+
+    def recv_batch(self, timeout: float = None) -> list:
+        """
+        Waits up to `timeout` seconds (forever if None) for the socket to
+        become readable, then reads every datagram already queued on it, up
+        to the batch size.
+
+        Return:
+            A list of views of the datagrams read, empty if the timeout
+            passed first.  The views are into buffers that are reused by the
+            next call, so anything that must outlive it has to be copied.
+        """
+        if not self._selector.select(timeout):
+            return []
+        batch = []
+        for view in self._views:
+            try:
+                size = self._sock.recv_into(view)
+            except BlockingIOError:
+                break
+            batch.append(view[:size])
+        return batch
+
+    def send(self, packet: bytes):
+        """Sends a datagram, waiting for room in the socket's send buffer
+        if it is full."""
+        while True:
+            try:
+                self._sock.send(packet)
+                return
+            except BlockingIOError:
+                select.select([], [self._sock], [])
+
+
+def _run_sender(sock: socket.socket, sender: Sender) -> TransferStats:
+    """Drives a Sender over a blocking socket until all data is acked, and
+    returns its stats."""
+    with BatchedSocket(sock) as batched:
+        while True:
+            for packet in sender.packets(time.monotonic()):
+                batched.send(packet)
+            if sender.finished:
+                close = sender.close_packet()
+                for _ in range(CLOSE_COPIES):
+                    batched.send(close)
+                return sender.stats
+
+            # Wait for acks, but no longer than the next retransmission
+            # deadline, then process every ack that has arrived before
+            # refilling the window.
+            wait = max(sender.deadline() - time.monotonic(), 0)
+            acks = batched.recv_batch(wait)
+            now = time.monotonic()
+            if not acks:
+                sender.on_timeout(now)
+                continue
+            for ack in acks:
+                sender.on_ack(ack, now)
+
+
+def send(sock: socket.socket, data: bytes, window: int = DEFAULT_WINDOW,
+         fec: bool = False, stats: TransferStats = None,
+         compression: str = None) -> TransferStats:
     """
     Implementation of the sending logic for sending data over a slow,
     lossy, constrained network.
@@ -19,125 +1168,416 @@ def send(sock: socket.socket, data: bytes):
         sock -- A socket object, constructed and initialized to communicate
                 over a simulated lossy network.
         data -- A bytes object, containing the data to send over the network.
+        window -- The maximum number of unacknowledged segments in flight.
+        fec -- Whether to send parity packets, so the receiver can rebuild
+               some lost segments without waiting for them to be resent.
+        stats -- A TransferStats to count the transfer's events in (pass a
+                 Telemetry to also get a timeline of them).  A new one is
+                 made if not given.
+        compression -- The name of a codec in CODECS to compress the data
+                       with, or None to send it as it is.
+
+    Return:
+        The transfer's stats.
+    """
+    def make_segments(codec: str):
+        if codec is None:
+            return single_stream(buffer_chunks(data))
+        return single_stream(compressed_chunks(io.BytesIO(data),
+                                               CODECS[codec]))
+    segments, fallback = offer(make_segments, compression)
+    return _run_sender(sock, Sender(segments, window, fec, stats, fallback))
+
+
+def send_stream(sock: socket.socket, readable: io.RawIOBase,
+                window: int = DEFAULT_WINDOW, fec: bool = False,
+                stats: TransferStats = None,
+                compression: str = None) -> TransferStats:
+    """
+    Like `send`, but pulls the data from a file object (or mmap) as the
+    window allows, instead of needing all of it in memory up front.  Only
+    unacknowledged segments are held, so memory use does not depend on the
+    size of the data, and the first packet is sent after the first read.
+
+    Args:
+        sock -- A socket object, constructed and initialized to communicate
+                over a simulated lossy network.
+        readable -- A binary file object, read from until it returns EOF.
+        window, fec, stats, compression -- As for `send`.
+
+    Return:
+        The transfer's stats.
+    """
+    segments, fallback = offer(
+        lambda codec: single_stream(read_chunks(readable, codec)),
+        compression)
+    return _run_sender(sock, Sender(segments, window, fec, stats, fallback))
+
+
+def send_streams(sock: socket.socket, readables: list,
+                 window: int = DEFAULT_WINDOW, fec: bool = False,
+                 stats: TransferStats = None,
+                 compression: str = None) -> TransferStats:
     """
-    logger = homework5.logging.get_logger("hw5-sender")
+    Sends several files at once over a single connection, as separate
+    streams numbered by their position in `readables`.  Chunks from each
+    file are interleaved round robin, and all streams share the one window,
+    so there is only one ramp up and one close for the whole batch.  Use
+    `recv_streams` to receive them.
 
-    # one-bit header contains the sequence number to aid retransmission
-    # and duplicate
-    next_seq = "0"
-    header_size = len(next_seq.encode())
+    Args:
+        sock -- A socket object, constructed and initialized to communicate
+                over a simulated lossy network.
+        readables -- A list of binary file objects, each read until EOF.
+        window, fec, stats, compression -- As for `send`.  Each stream is
+            compressed (or not) separately.
 
-    alpha = 0.125  # typical value for calculating estimated_rtt
-    beta = 0.25  # typical value for calculating dev_rtt
+    Return:
+        The transfer's stats.
+    """
+    segments, fallback = offer(
+        lambda codec: interleave_streams([read_chunks(readable, codec)
+                                          for readable in readables]),
+        compression)
+    return _run_sender(sock, Sender(segments, window, fec, stats, fallback))
 
-    # initial values
-    estimated_rtt = 0
-    dev_rtt = 0
-    timeout_interval = 1.5  # arbitrary but should not be too low
 
-    # size of payload after subtracting MAX_PACKET (1400 bytes) by header size
-    chunk_size = homework5.MAX_PACKET - header_size
+def sack_blocks(segments: dict) -> bytes:
+    """
+    Encodes the numbers of the out of order segments held by the receiver
+    as a series of [start, end) ranges, lowest first.
+    """
+    blocks = []
+    start = end = None
+    for seq in sorted(segments):
+        if seq == end:
+            end += 1
+            continue
+        if start is not None:
+            blocks.append(SACK_BLOCK.pack(start, end))
+            if len(blocks) == MAX_SACK_BLOCKS:
+                return b"".join(blocks)
+        start, end = seq, seq + 1
+    if start is not None:
+        blocks.append(SACK_BLOCK.pack(start, end))
+    return b"".join(blocks)
 
-    pause = .001  # let network rest in case delay = 0
-    offsets = range(0, len(data), chunk_size)
-    first_packet = True  # flag to set estimated_rtt and dev_rtt the first time
-    for chunk in [data[i:i + chunk_size] for i in offsets]:
-        sock.settimeout(timeout_interval)
 
-        # create packet by concatenating header and payload
-        packet = next_seq.encode() + chunk
+class ReassemblyBuffer:
+    """
+    Puts received segments back in order, and writes each stream's data to
+    its destination in large contiguous blocks rather than one write (and
+    flush) per packet.
 
-        sock.send(packet)
+    Segments that arrive past a gap are held until the gap is filled.  In
+    order data collects in a pending block per stream, which is written out
+    once it reaches `flush_size` bytes, once data has waited
+    `flush_interval` seconds, when its stream ends, or when `flush` is
+    called at the end of the transfer.  Destinations are opened on demand,
+    by calling `open_dest` with the stream number.
 
-        # flag to check if the current packet was resent previously
-        # in order to decide sample_rtt calculation
-        was_resent = False
+    If the sender uses FEC mode, a segment lost from a group is rebuilt
+    from the group's parity packet (see `ParityDecoder`).  If it compresses
+    the streams, its HELLO names the codec, and each stream's data is
+    decompressed as it is written; a codec it doesn't know is refused, so
+    the sender falls back to sending the streams as they are.
+    """
 
-        start_time = time.time()  # start timer for sample_rtt calculation
+    def __init__(self, open_dest,
+                 flush_size: int = DEFAULT_FLUSH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 stats: TransferStats = None):
+        self._logger = homework5.logging.get_logger("hw5-receiver")
+        self.stats = stats if stats is not None else TransferStats()
+        self._parity = ParityDecoder()
+        self._open_dest = open_dest
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._dests = {}  # stream -> destination
+        self._pending = {}  # stream -> pending block
+        self._codec = None  # codec named by the sender's HELLO, if any
+        self.refused = False  # whether that codec was unknown
+        self._decoders = {}  # stream -> StreamDecompressor
+        self._pending_since = None  # when data started waiting to be written
+        self.expect_seq = 0  # next segment to pass up to the destination
+        self.fin_seq = None  # segment number of the sender's FIN, once seen
+        # segment number -> (kind, stream, payload), past a gap
+        self.out_of_order = {}
+        self.stream_bytes = {}  # stream -> size of payload written so far
+        self.closed = False  # whether the sender confirmed the FIN-ACK
+        self.fin_wait = 0.0  # FIN_WAIT of the sender's latest FIN
 
-        # update sequence number
-        last_seq = next_seq
-        next_seq = "0" if last_seq == "1" else "1"
+    @property
+    def num_bytes(self) -> int:
+        """Size of payload written so far, over all streams."""
+        return sum(self.stream_bytes.values())
 
-        received_ack = False
-        # wait until the correct Ack received, then send the next payload chunk
-        while not received_ack:
-            try:
-                ack = sock.recv(homework5.MAX_PACKET)
-
-                # split data into sequence number and payload
-                seq_num, payload = ack[:1].decode(), ack[1:]
-                logger.info("Ack seq#%s payload:%s timeout:%f.2", seq_num,
-                            payload, timeout_interval)
-
-                if seq_num == last_seq:  # correct Ack
-                    received_ack = True
-
-                    # if this is not a packet that was resent,
-                    # calculate timeout interval
-                    if not was_resent:
-                        sample_rtt = time.time() - start_time
-                        if first_packet:
-                            first_packet = False
-                            # typical values for the first time calculation
-                            estimated_rtt = sample_rtt
-                            dev_rtt = sample_rtt/2
-                        else:
-                            estimated_rtt = ((1 - alpha)*estimated_rtt +
-                                             alpha*sample_rtt)
-                            dev_rtt = ((1 - beta)*dev_rtt +
-                                       beta*abs(sample_rtt - estimated_rtt))
-                        timeout_interval = estimated_rtt + 4*dev_rtt
-
-            except socket.timeout:
-                logger.info("Timeout for ACK, resending a packet...")
-                sock.send(packet)
-                was_resent = True
-
-        logger.info("Pausing for %f seconds", round(pause, 2))
-        time.sleep(pause)
-
-
-def recv(sock: socket.socket, dest: io.BufferedIOBase) -> int:
+    @property
+    def finished(self) -> bool:
+        """Whether everything up to and including the FIN has arrived."""
+        return self.fin_seq is not None and self.expect_seq > self.fin_seq
+
+    def linger(self, linger: float) -> float:
+        """How long to wait for the sender's CLOSE after a FIN: `linger`
+        seconds, or as long as the sender may still resend the FIN, if that
+        is longer."""
+        return max(linger, min(self.fin_wait, MAX_FIN_WAIT))
+
+    def received(self, seq: int) -> bool:
+        """Whether segment `seq` has already arrived."""
+        return seq < self.expect_seq or seq in self.out_of_order
+
+    def add(self, kind: PacketKind, stream: int, seq: int, payload: bytes,
+            now: float):
+        """Accepts a segment, passing it (along with any buffered segments
+        it makes contiguous) to its stream if it is the next one expected,
+        or holding it if it is past a gap.  Duplicates and segments too far
+        ahead of the receiver are ignored.
+        """
+        if kind == PacketKind.FIN and seq >= self.expect_seq:
+            self.fin_seq = seq
+        if seq == self.expect_seq:
+            while True:
+                self._deliver(kind, stream, payload, now)
+                self.expect_seq += 1
+                if self.expect_seq not in self.out_of_order:
+                    break
+                kind, stream, payload = self.out_of_order.pop(self.expect_seq)
+        elif self.expect_seq < seq < self.expect_seq + RECV_WINDOW:
+            # the payload may be a view into a reused receive buffer, so
+            # take a copy of anything that has to wait
+            self.out_of_order[seq] = kind, stream, bytes(payload)
+
+    def on_packet(self, data: bytes, now: float) -> bytes:
+        """Processes a packet from the sender, and returns the ack to send
+        back, or None if the packet needs no ack."""
+        # split kind, stream, sequence number and payload, without copying
+        # the payload.  Damaged packets go unacked, so they are resent.
+        if not intact(data, DATA_HEADER):
+            self._logger.info("Dropping corrupted packet")
+            self.stats.corrupted += 1
+            return None
+        _, kind, stream, seq, stamp, length = DATA_HEADER.unpack_from(data)
+        payload = memoryview(data)[DATA_HEADER.size:]
+        if kind not in SENDER_KINDS:
+            self._logger.info("Dropping a packet that is not from a sender")
+            return None
+        if len(payload) != length:
+            self._logger.info("Dropping packet %d, %d of %d payload bytes",
+                              seq, len(payload), length)
+            self.stats.corrupted += 1
+            return None
+        if kind == PacketKind.CLOSE:
+            self.closed = self.finished
+            return None
+        if kind == PacketKind.FIN:
+            # the payload is the sender's FIN_WAIT, which parity leaves out
+            if len(payload) == FIN_WAIT.size:
+                self.fin_wait = FIN_WAIT.unpack(payload)[0] / 1000
+            payload = payload[:0]
+        was_finished = self.finished
+        trigger = seq
+        duplicate = kind != PacketKind.PARITY and self.received(seq)
+        self.stats.duplicates += duplicate
+        self.stats.on_receive(now, seq, kind, duplicate)
+        if kind == PacketKind.PARITY:
+            self.stats.parity_received += 1
+            recovered = self._parity.recover(seq, stream, payload,
+                                             self.received)
+            if recovered is None:
+                return None
+            self._logger.info("Rebuilt segment %d from parity", recovered[0])
+            self.stats.fec_recoveries += 1
+            seq, kind, stream, payload = recovered
+            trigger = RECOVERED_TRIGGER
+        elif not duplicate:
+            self._parity.add(seq, kind, stream, payload)
+        self.add(kind, stream, seq, payload, now)
+        if self.finished and not was_finished:
+            # everything has been delivered, so write it out before sending
+            # the FIN-ACK
+            self.flush()
+
+        # ack every segment, even duplicates, since the earlier ack may have
+        # been lost
+        ack_kind = PacketKind.REFUSE if self.refused else PacketKind.ACK
+        ack = bytearray(ACK_HEADER.pack(0, ack_kind, trigger,
+                                        self.expect_seq, stamp))
+        ack += sack_blocks(self.out_of_order)
+        seal(ack)
+        return ack
+
+    def _deliver(self, kind: PacketKind, stream: int, payload: bytes,
+                 now: float):
+        if kind == PacketKind.HELLO:
+            name = bytes(payload).decode("ascii", "replace")
+            if name not in CODECS:
+                self._logger.info("Refusing unknown codec %r", name)
+                self.refused = True
+                return
+            self._logger.info("Streams are compressed with %s", name)
+            self._codec = CODECS[name]
+            return
+        if kind == PacketKind.FIN:
+            for open_stream in self._dests:
+                self._end_stream(open_stream)
+            return
+        if stream not in self._dests:
+            self._dests[stream] = self._open_dest(stream)
+            self._pending[stream] = bytearray()
+            self.stream_bytes[stream] = 0
+            if self._codec is not None:
+                self._decoders[stream] = StreamDecompressor(self._codec)
+        if kind == PacketKind.END:
+            self._logger.info("Stream %d ended", stream)
+            self._end_stream(stream)
+            return
+        pending = self._pending[stream]
+        if self._pending_since is None:
+            self._pending_since = now
+        pending += payload
+        if len(pending) >= self._flush_size:
+            self._flush_stream(stream)
+
+    def flush_deadline(self) -> float:
+        """The time by which pending data should be written, or None if
+        nothing is pending."""
+        if self._pending_since is None:
+            return None
+        return self._pending_since + self._flush_interval
+
+    def _write(self, stream: int, data: bytes):
+        if not data:
+            return
+        dest = self._dests[stream]
+        dest.write(data)
+        dest.flush()
+        self.stream_bytes[stream] += len(data)
+        self.stats.bytes_delivered += len(data)
+
+    def _flush_stream(self, stream: int):
+        pending = self._pending[stream]
+        if not pending:
+            return
+        decoder = self._decoders.get(stream)
+        self._write(stream, pending if decoder is None
+                    else decoder.decompress(pending))
+        pending.clear()
+
+    def _end_stream(self, stream: int):
+        self._flush_stream(stream)
+        decoder = self._decoders.pop(stream, None)
+        if decoder is not None:
+            self._write(stream, decoder.flush())
+
+    def flush(self):
+        """Writes every stream's pending block to its destination."""
+        for stream in self._pending:
+            self._flush_stream(stream)
+        self._pending_since = None
+
+
+def _run_receiver(sock: socket.socket, reassembly: ReassemblyBuffer,
+                  linger: float):
+    """Drives a ReassemblyBuffer over a blocking socket until the sender
+    closes the connection."""
+    logger = homework5.logging.get_logger("hw5-receiver")
+
+    linger_until = None
+    try:
+        with BatchedSocket(sock) as batched:
+            while True:
+                # Once everything has arrived, only wait for the sender's
+                # CLOSE (re-acking any resent FIN).  Before that, don't let
+                # pending data sit past its flush deadline just because no
+                # more packets are arriving.
+                deadline = (linger_until if reassembly.finished
+                            else reassembly.flush_deadline())
+                wait = None
+                if deadline is not None:
+                    wait = max(deadline - time.monotonic(), 0)
+                batch = batched.recv_batch(wait)
+                if not batch:
+                    if reassembly.finished:
+                        logger.info("Sender never closed, giving up")
+                        return
+                    reassembly.flush()
+                    continue
+
+                now = time.monotonic()
+                for data in batch:
+                    if not data:
+                        continue
+                    logger.debug("Received %d bytes", len(data))
+                    ack = reassembly.on_packet(data, now)
+                    if reassembly.closed:
+                        return
+                    if ack is not None:
+                        batched.send(ack)
+                if reassembly.finished:
+                    linger_until = now + reassembly.linger(linger)
+    finally:
+        reassembly.flush()
+
+
+def recv(sock: socket.socket, dest: io.BufferedIOBase,
+         flush_size: int = DEFAULT_FLUSH_SIZE,
+         flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+         linger: float = DEFAULT_LINGER,
+         stats: TransferStats = None) -> int:
     """
     Implementation of the receiving logic for receiving data over a slow,
     lossy, constrained network.
 
+    Returns once the sender's FIN has been received and acked, and the
+    sender has confirmed the FIN-ACK (or `linger` seconds, or however long
+    the sender said it may go on resending the FIN if that is longer, have
+    passed without hearing from it).
+
     Args:
         sock -- A socket object, constructed and initialized to communicate
                 over a simulated lossy network.
+        dest -- A binary file object the received data is written to.
+        flush_size -- Number of in order bytes to collect before writing
+                      them to `dest`.
+        flush_interval -- Longest time, in seconds, received data may wait
+                          before being written to `dest`.
+        linger -- Longest time, in seconds, to wait for the sender to
+                  confirm the FIN-ACK.
+        stats -- A TransferStats to count the transfer's events in.
 
     Return:
         The number of bytes written to the destination.
     """
-    logger = homework5.logging.get_logger("hw5-receiver")
-
-    expect_seq = "0"  # first sequence number
-    ack = ""  # place holder for acknowledgement
-    num_bytes = 0  # size of payload received so far
-    while True:
-        data = sock.recv(homework5.MAX_PACKET)
-        if not data:
-            break
-        logger.info("Received %d bytes", len(data))
-
-        last_seq = expect_seq
-
-        # split sequence number and payload
-        seq_num, payload = data[:1].decode(), data[1:]
-
-        if seq_num == expect_seq:  # correct sequence number
+    reassembly = ReassemblyBuffer(lambda stream: dest, flush_size,
+                                  flush_interval, stats)
+    _run_receiver(sock, reassembly, linger)
+    return reassembly.num_bytes
 
-            # simulate passing data to the above layer
-            dest.write(payload)
-            num_bytes += len(payload)
-            dest.flush()
 
-            ack = last_seq.encode()  # create acknowledgement
-
-            # update sequence number
-            expect_seq = "0" if last_seq == "1" else "1"
+def recv_streams(sock: socket.socket, open_dest,
+                 flush_size: int = DEFAULT_FLUSH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 linger: float = DEFAULT_LINGER,
+                 stats: TransferStats = None) -> dict:
+    """
+    Receives the streams sent by `send_streams`, writing each one to its
+    own destination.  Each stream's data is flushed as soon as its END
+    arrives, so its destination is complete before the others finish.
 
-        sock.send(ack)  # send Ack
+    Args:
+        sock -- A socket object, constructed and initialized to communicate
+                over a simulated lossy network.
+        open_dest -- Called with a stream number the first time the stream
+                     is seen, and returns the binary file object its data
+                     is written to.  Closing them is left to the caller.
+        flush_size, flush_interval, linger, stats -- As for `recv`.
 
-    return num_bytes
+    Return:
+        A dict mapping each stream number to the number of bytes written
+        to its destination.
+    """
+    reassembly = ReassemblyBuffer(open_dest, flush_size, flush_interval,
+                                  stats)
+    _run_receiver(sock, reassembly, linger)
+    return reassembly.stream_bytes
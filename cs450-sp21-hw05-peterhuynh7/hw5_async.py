@@ -0,0 +1,308 @@
+"""
+asyncio versions of the hw5 sender and receiver.
+
+These drive the same `hw5.Sender` and `hw5.ReassemblyBuffer` state machines
+as the blocking `hw5.send` and `hw5.recv`, but from datagram protocols on an
+event loop, with retransmission and flush deadlines kept as loop timers
+instead of socket timeouts.  That lets a single thread (the same one running
+`homework5.wire.CrummyWireProtocol`, if desired) drive any number of
+transfers at once, each over its own named link of the wire.
+"""
+
+import asyncio
+import io
+import time
+import homework5
+import homework5.logging
+import homework5.wire
+import hw5
+
+WIRE_HOST = "127.0.0.1"
+
+# The connect message is a datagram like any other, and a busy wire can miss
+# it.  Receivers resend it this often, in seconds, until the first packet
+# arrives, and senders resend it with every retransmission.
+CONNECT_INTERVAL = 0.5
+
+
+class SenderProtocol(asyncio.DatagramProtocol):
+    """
+    Sends the data of a `hw5.Sender` over a datagram endpoint connected to
+    the wire, on the named link if `link` is given.  `done` resolves once
+    the FIN has been acked (or given up on; see `hw5.FIN_RETRIES`).
+    """
+
+    def __init__(self, sender: hw5.Sender, done: asyncio.Future,
+                 link: str = None):
+        self._sender = sender
+        self._done = done
+        self._link = link
+        self._transport = None
+        self._timer = None
+        self._timer_deadline = None
+        self._logger = homework5.logging.get_logger("hw5-sender")
+
+    def connection_made(self, transport):
+        self._transport = transport
+        transport.sendto(homework5.wire.connect_message(self._link))
+        self._pump()
+
+    def datagram_received(self, data, addr):
+        if self._done.done():
+            return
+        self._sender.on_ack(data, time.monotonic())
+        self._pump()
+
+    def error_received(self, exc):
+        self._logger.info("Error from the wire: %s", exc)
+
+    def connection_lost(self, exc):
+        self._cancel_timer()
+        if not self._done.done():
+            self._done.set_exception(
+                exc or ConnectionError("Transport closed before the "
+                                       "transfer finished"))
+
+    def _pump(self):
+        """Sends whatever the window allows, and re-arms the retransmission
+        timer for the oldest segment still in flight."""
+        for packet in self._sender.packets(time.monotonic()):
+            self._transport.sendto(packet)
+        if self._sender.finished:
+            self._cancel_timer()
+            close = self._sender.close_packet()
+            for _ in range(hw5.CLOSE_COPIES):
+                self._transport.sendto(close)
+            self._done.set_result(None)
+            self._transport.close()
+            return
+
+        deadline = self._sender.deadline()
+        if self._timer is not None and self._timer_deadline == deadline:
+            return
+        self._cancel_timer()
+        loop = asyncio.get_event_loop()
+        self._timer = loop.call_later(max(deadline - time.monotonic(), 0),
+                                      self._on_timer)
+        self._timer_deadline = deadline
+
+    def _on_timer(self):
+        self._timer = None
+        self._transport.sendto(homework5.wire.connect_message(self._link))
+        self._sender.on_timeout(time.monotonic())
+        self._pump()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class ReceiverProtocol(asyncio.DatagramProtocol):
+    """
+    Receives data into a `hw5.ReassemblyBuffer` over a datagram endpoint
+    connected to the wire, on the named link if `link` is given.
+    `connected` resolves once the wire has been told about this endpoint,
+    and `done` once the sender has closed the connection (or a linger
+    after the FIN-ACK, if it never does; see `hw5.ReassemblyBuffer.linger`).
+    """
+
+    def __init__(self, reassembly: hw5.ReassemblyBuffer, linger: float,
+                 connected: asyncio.Future, done: asyncio.Future,
+                 link: str = None):
+        self._reassembly = reassembly
+        self._linger = linger
+        self._link = link
+        self._connected = connected
+        self._done = done
+        self._transport = None
+        self._flush_timer = None
+        self._linger_timer = None
+        self._connect_timer = None
+        self._logger = homework5.logging.get_logger("hw5-receiver")
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._connect()
+        self._connected.set_result(None)
+
+    def _connect(self):
+        self._transport.sendto(homework5.wire.connect_message(self._link))
+        self._connect_timer = asyncio.get_event_loop().call_later(
+            CONNECT_INTERVAL, self._connect)
+
+    def datagram_received(self, data, addr):
+        if self._done.done():
+            return
+        if self._connect_timer is not None:
+            self._connect_timer.cancel()
+            self._connect_timer = None
+        self._logger.debug("Received %d bytes", len(data))
+        ack = self._reassembly.on_packet(data, time.monotonic())
+        if self._reassembly.closed:
+            self._finish()
+            return
+        if ack is not None:
+            self._transport.sendto(ack)
+
+        loop = asyncio.get_event_loop()
+        if self._reassembly.finished:
+            # (re)start waiting for the sender's CLOSE
+            if self._linger_timer is not None:
+                self._linger_timer.cancel()
+            self._linger_timer = loop.call_later(
+                self._reassembly.linger(self._linger), self._finish)
+        elif self._flush_timer is None:
+            deadline = self._reassembly.flush_deadline()
+            if deadline is not None:
+                self._flush_timer = loop.call_later(
+                    max(deadline - time.monotonic(), 0), self._on_flush_timer)
+
+    def error_received(self, exc):
+        self._logger.info("Error from the wire: %s", exc)
+
+    def connection_lost(self, exc):
+        self._cancel_timers()
+        self._reassembly.flush()
+        if not self._done.done():
+            self._done.set_exception(
+                exc or ConnectionError("Transport closed before the "
+                                       "transfer finished"))
+
+    def _on_flush_timer(self):
+        self._flush_timer = None
+        self._reassembly.flush()
+
+    def _finish(self):
+        if not self._reassembly.closed:
+            self._logger.info("Sender never closed, giving up")
+        self._cancel_timers()
+        self._reassembly.flush()
+        self._done.set_result(None)
+        self._transport.close()
+
+    def _cancel_timers(self):
+        for timer in (self._flush_timer, self._linger_timer,
+                      self._connect_timer):
+            if timer is not None:
+                timer.cancel()
+        self._flush_timer = self._linger_timer = self._connect_timer = None
+
+
+async def _run_sender(port: int, sender: hw5.Sender,
+                      link: str = None) -> hw5.TransferStats:
+    loop = asyncio.get_event_loop()
+    done = loop.create_future()
+    await loop.create_datagram_endpoint(
+        lambda: SenderProtocol(sender, done, link),
+        remote_addr=(WIRE_HOST, port))
+    await done
+    return sender.stats
+
+
+async def send(port: int, data: bytes, window: int = hw5.DEFAULT_WINDOW,
+               fec: bool = False, stats: hw5.TransferStats = None,
+               compression: str = None,
+               link: str = None) -> hw5.TransferStats:
+    """
+    Sends data over the wire listening on `port`, like `hw5.send`.
+
+    Args:
+        port -- The port the simulated lossy network is listening on.
+        data -- A bytes object, containing the data to send over the network.
+        window -- The maximum number of unacknowledged segments in flight.
+        fec -- Whether to send parity packets (see `hw5.ParityEncoder`).
+        stats -- A `hw5.TransferStats` to count the transfer's events in.
+        compression -- The name of a codec in `hw5.CODECS`, or None.
+        link -- The name of the wire's link to send over, shared with the
+                receiver (see `homework5.wire.bad_socket`).  Concurrent
+                transfers over one wire each need a name of their own.
+
+    Return:
+        The transfer's stats.
+    """
+    return await send_stream(port, io.BytesIO(data), window, fec, stats,
+                             compression, link)
+
+
+async def send_stream(port: int, readable: io.RawIOBase,
+                      window: int = hw5.DEFAULT_WINDOW, fec: bool = False,
+                      stats: hw5.TransferStats = None,
+                      compression: str = None,
+                      link: str = None) -> hw5.TransferStats:
+    """Like `send`, but reads the data from a file object as the window
+    allows, like `hw5.send_stream`."""
+    segments, fallback = hw5.offer(
+        lambda codec: hw5.single_stream(hw5.read_chunks(readable, codec)),
+        compression)
+    return await _run_sender(
+        port, hw5.Sender(segments, window, fec, stats, fallback), link)
+
+
+async def send_streams(port: int, readables: list,
+                       window: int = hw5.DEFAULT_WINDOW, fec: bool = False,
+                       stats: hw5.TransferStats = None,
+                       compression: str = None,
+                       link: str = None) -> hw5.TransferStats:
+    """Sends several files as streams of one connection, like
+    `hw5.send_streams`."""
+    segments, fallback = hw5.offer(
+        lambda codec: hw5.interleave_streams([hw5.read_chunks(readable, codec)
+                                              for readable in readables]),
+        compression)
+    return await _run_sender(
+        port, hw5.Sender(segments, window, fec, stats, fallback), link)
+
+
+async def connect_receiver(port: int, open_dest,
+                           flush_size: int = hw5.DEFAULT_FLUSH_SIZE,
+                           flush_interval: float = hw5.DEFAULT_FLUSH_INTERVAL,
+                           linger: float = hw5.DEFAULT_LINGER,
+                           stats: hw5.TransferStats = None,
+                           link: str = None):
+    """
+    Connects a receiver to the wire listening on `port`, and returns as soon
+    as it is ready for a sender to start, so that senders don't have to
+    guess how long to wait.
+
+    Args:
+        port -- The port the simulated lossy network is listening on.
+        open_dest, flush_size, flush_interval, linger, stats -- As for
+            `hw5.recv_streams`.
+        link -- The name of the wire's link to receive on, as for `send`.
+
+    Return:
+        A future that resolves to a dict mapping each stream number to the
+        number of bytes written to its destination, once the transfer has
+        been closed.
+    """
+    loop = asyncio.get_event_loop()
+    connected = loop.create_future()
+    done = loop.create_future()
+    reassembly = hw5.ReassemblyBuffer(open_dest, flush_size, flush_interval,
+                                      stats)
+    await loop.create_datagram_endpoint(
+        lambda: ReceiverProtocol(reassembly, linger, connected, done, link),
+        remote_addr=(WIRE_HOST, port))
+    await connected
+
+    async def stream_bytes():
+        await done
+        return reassembly.stream_bytes
+    return asyncio.ensure_future(stream_bytes())
+
+
+async def recv(port: int, dest: io.BufferedIOBase,
+               flush_size: int = hw5.DEFAULT_FLUSH_SIZE,
+               flush_interval: float = hw5.DEFAULT_FLUSH_INTERVAL,
+               linger: float = hw5.DEFAULT_LINGER,
+               stats: hw5.TransferStats = None, link: str = None) -> int:
+    """
+    Receives data over the wire listening on `port`, like `hw5.recv`.
+
+    Return:
+        The number of bytes written to the destination.
+    """
+    received = await connect_receiver(port, lambda stream: dest, flush_size,
+                                      flush_interval, linger, stats, link)
+    return sum((await received).values())
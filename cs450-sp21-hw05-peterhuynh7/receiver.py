@@ -5,9 +5,13 @@ to STDOUT.
 """
 
 import argparse
+import os
 import sys
+import signal
 import logging
+import homework5.logging
 import homework5.wire
+import homework5.utils
 import hw5
 
 PARSER = argparse.ArgumentParser(description="Client script for sending data "
@@ -15,9 +19,27 @@ PARSER = argparse.ArgumentParser(description="Client script for sending data "
                                              "connection.")
 PARSER.add_argument("-p", "--port", type=int, default=9999,
                     help="The port to connect to the simulated network over.")
-PARSER.add_argument("-f", "--file", type=str,
+PARSER.add_argument("--link", default=None,
+                    help="The name of the link to join on the simulated "
+                         "network, so that several transfers can share one "
+                         "server.  The sender must give the same name.")
+PARSER.add_argument("-f", "--file", type=str, nargs="*",
                     help="The path to write the data recorded over the buffer "
-                         "to (default=STDOUT).")
+                         "to (default=STDOUT).  If the sender sends several "
+                         "streams, give one path per stream, in the same "
+                         "order as the sender's files; streams past the "
+                         "last path are dropped.")
+PARSER.add_argument('--ready-fd', type=int, default=None,
+                    help="A file descriptor to write a byte to, and close, "
+                         "once the receiver is connected.")
+PARSER.add_argument("--stats", default=None,
+                    help="A path to write counts of received parity packets "
+                         "and rebuilt packets to, as JSON, once the transfer "
+                         "is done.")
+PARSER.add_argument("--telemetry", default=None,
+                    help="A path to write a timeline of every packet "
+                         "received to, as CSV if it ends in .csv and as "
+                         "JSON otherwise.")
 PARSER.add_argument('-v', '--verbose', action="store_true",
                     help="Enable extra verbose mode.")
 ARGS = PARSER.parse_args()
@@ -25,11 +47,44 @@ ARGS = PARSER.parse_args()
 if ARGS.verbose:
     logging.getLogger('hw5-receiver').setLevel(logging.DEBUG)
 
-OUTPUT = open(ARGS.file, 'wb') if ARGS.file else sys.stdout.buffer
+# If the receiver is stopped with SIGTERM, turn that into a normal exit so
+# any data hw5 is still holding gets written out.
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-SOC = homework5.wire.bad_socket(ARGS.port)
+if ARGS.file:
+    OUTPUTS = [open(path, 'wb') for path in ARGS.file]
+else:
+    OUTPUTS = [sys.stdout.buffer]
 
-hw5.recv(SOC, OUTPUT)
+LOGGER = homework5.logging.get_logger("hw5-receiver")
+SINKS = []
+
+
+def open_dest(stream: int):
+    """Returns the output for a stream, or a sink for streams past the
+    last path given, so that their data is dropped rather than stopping the
+    transfer."""
+    if stream < len(OUTPUTS):
+        return OUTPUTS[stream]
+    LOGGER.info("No path given for stream %d (only %d given), dropping its "
+                "data", stream, len(OUTPUTS))
+    sink = open(os.devnull, 'wb')
+    SINKS.append(sink)
+    return sink
+
+
+SOC = homework5.wire.bad_socket(ARGS.port, ARGS.link)
+
+if ARGS.ready_fd is not None:
+    homework5.utils.signal_ready(ARGS.ready_fd)
+
+STATS = hw5.Telemetry() if ARGS.telemetry else hw5.TransferStats()
+hw5.recv_streams(SOC, open_dest, stats=STATS)
 
 SOC.close()
-OUTPUT.close()
+for OUTPUT in OUTPUTS + SINKS:
+    OUTPUT.close()
+if ARGS.stats:
+    STATS.write_json(ARGS.stats)
+if ARGS.telemetry:
+    STATS.write_timeline(ARGS.telemetry)
@@ -5,6 +5,7 @@ Client that sends STDIN, over a simulated faulty network connection.
 
 import argparse
 import logging
+import contextlib
 import homework5.wire
 import hw5
 
@@ -13,8 +14,32 @@ PARSER = argparse.ArgumentParser(description="Client script for sending data "
                                              "connection.")
 PARSER.add_argument("-p", "--port", type=int, default=9999,
                     help="The port to connect to the simulated network over.")
-PARSER.add_argument("-f", "--file", required=True,
-                    help="The file to send over the simulated network.")
+PARSER.add_argument("--link", default=None,
+                    help="The name of the link to join on the simulated "
+                         "network, so that several transfers can share one "
+                         "server.  The receiver must give the same name.")
+PARSER.add_argument("-f", "--file", required=True, nargs="+",
+                    help="The file to send over the simulated network.  If "
+                         "several are given, they are sent at once as "
+                         "separate streams of one connection.")
+PARSER.add_argument("-w", "--window", type=int, default=hw5.DEFAULT_WINDOW,
+                    help="The number of unacknowledged packets to keep in "
+                         "flight (defaults to {}).".format(hw5.DEFAULT_WINDOW))
+PARSER.add_argument("--fec", action="store_true",
+                    help="Send parity packets, so the receiver can rebuild "
+                         "some lost packets without waiting for a resend.")
+PARSER.add_argument("-c", "--compress", choices=sorted(hw5.CODECS),
+                    default=None,
+                    help="Compress each file with this codec before sending "
+                         "it (files that barely compress are sent as they "
+                         "are).")
+PARSER.add_argument("--stats", default=None,
+                    help="A path to write counts of sent, resent and parity "
+                         "packets to, as JSON, once the transfer is done.")
+PARSER.add_argument("--telemetry", default=None,
+                    help="A path to write a timeline of every send, ack, "
+                         "RTT sample and timeout to, as CSV if it ends in "
+                         ".csv and as JSON otherwise.")
 PARSER.add_argument('-v', '--verbose', action="store_true",
                     help="Enable extra verbose mode.")
 ARGS = PARSER.parse_args()
@@ -22,9 +47,20 @@ ARGS = PARSER.parse_args()
 if ARGS.verbose:
     logging.getLogger('hw5-sender').setLevel(logging.DEBUG)
 
-DATA = open(ARGS.file, 'rb').read()
-SOC = homework5.wire.bad_socket(ARGS.port)
+SOC = homework5.wire.bad_socket(ARGS.port, ARGS.link)
+STATS = hw5.Telemetry() if ARGS.telemetry else hw5.TransferStats()
 
-hw5.send(SOC, DATA)
+with contextlib.ExitStack() as STACK:
+    DATA = [STACK.enter_context(open(path, 'rb')) for path in ARGS.file]
+    if len(DATA) == 1:
+        hw5.send_stream(SOC, DATA[0], ARGS.window, ARGS.fec, STATS,
+                        ARGS.compress)
+    else:
+        hw5.send_streams(SOC, DATA, ARGS.window, ARGS.fec, STATS,
+                         ARGS.compress)
 
 SOC.close()
+if ARGS.stats:
+    STATS.write_json(ARGS.stats)
+if ARGS.telemetry:
+    STATS.write_timeline(ARGS.telemetry)
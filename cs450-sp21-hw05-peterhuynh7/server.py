@@ -3,10 +3,12 @@ Python code that simulates network connections by sitting between two
 socket connections.
 """
 import sys
+import signal
 import argparse
 import logging
 import homework5.wire
 import homework5.logging
+import homework5.utils
 
 # Grab the dockblock of the current module, to avoid redundantly describing
 # what this program does.
@@ -22,6 +24,45 @@ PARSER.add_argument('-d', '--delay', type=float, default=0.0,
                          "forwarding a packet on.")
 PARSER.add_argument('-b', '--buffer', type=int, default=100000,
                     help="The size of the buffer to simulate.")
+PARSER.add_argument('--profile', default=None,
+                    help="A JSON file of link profile fields (bandwidth, "
+                         "jitter, jitter_dist, reorder, reorder_delay, "
+                         "burst_enter, burst_exit, burst_loss, corrupt, "
+                         "seed).  Any of the options below override it.")
+PARSER.add_argument('--bandwidth', type=float, default=None,
+                    help="Bytes per second the link can carry (defaults to "
+                         "no limit).")
+PARSER.add_argument('--jitter', type=float, default=None,
+                    help="Scale, in seconds, of the random extra delay "
+                         "added to each packet.")
+PARSER.add_argument('--jitter-dist', default=None,
+                    choices=homework5.wire.JITTER_DISTRIBUTIONS,
+                    help="The distribution jitter is drawn from (defaults "
+                         "to uniform).")
+PARSER.add_argument('--reorder', type=float, default=None,
+                    help="The chance of holding a packet back so later "
+                         "packets overtake it.")
+PARSER.add_argument('--reorder-delay', type=float, default=None,
+                    help="The number of seconds a reordered packet is held "
+                         "back for (defaults to 0.01).")
+PARSER.add_argument('--burst-enter', type=float, default=None,
+                    help="The chance, per packet, of a burst of loss "
+                         "starting.")
+PARSER.add_argument('--burst-exit', type=float, default=None,
+                    help="The chance, per packet, of a burst of loss ending "
+                         "(defaults to 1).")
+PARSER.add_argument('--burst-loss', type=float, default=None,
+                    help="The percentage of packets to drop during a burst "
+                         "(defaults to 1).")
+PARSER.add_argument('--corrupt', type=float, default=None,
+                    help="The chance of flipping a random bit in a packet "
+                         "that isn't dropped.")
+PARSER.add_argument('--seed', type=int, default=None,
+                    help="Seed for the random choices the wire makes, so a "
+                         "run can be repeated exactly.")
+PARSER.add_argument('--ready-fd', type=int, default=None,
+                    help="A file descriptor to write a byte to, and close, "
+                         "once the wire is ready.")
 PARSER.add_argument('-v', '--verbose', action="store_true",
                     help="Enable extra verbose mode.")
 ARGS = PARSER.parse_args()
@@ -29,8 +70,25 @@ ARGS = PARSER.parse_args()
 if ARGS.verbose:
     logging.getLogger('hw5-wire').setLevel(logging.DEBUG)
 
+PROFILE_FIELDS = {}
+if ARGS.profile:
+    PROFILE_FIELDS.update(homework5.wire.LinkProfile.load(ARGS.profile)
+                          .as_dict())
+for A_FIELD in homework5.wire.LinkProfile.FIELDS:
+    if getattr(ARGS, A_FIELD) is not None:
+        PROFILE_FIELDS[A_FIELD] = getattr(ARGS, A_FIELD)
+PROFILE = homework5.wire.LinkProfile(**PROFILE_FIELDS)
+
 TRANSPORT, LOOP = homework5.wire.create_server(ARGS.port, ARGS.loss,
-                                               ARGS.delay, ARGS.buffer)
+                                               ARGS.delay, ARGS.buffer,
+                                               PROFILE)
+
+if ARGS.ready_fd is not None:
+    homework5.utils.signal_ready(ARGS.ready_fd)
+
+# Stop cleanly on SIGTERM (which is how tester.py stops the wire), so any
+# queued log messages are still written out.
+LOOP.add_signal_handler(signal.SIGTERM, LOOP.stop)
 
 try:
     LOOP.run_forever()
@@ -10,9 +10,12 @@ import sys
 import os
 import tempfile
 import signal
+import json
+import csv
 import logging
 import homework5.logging
 import homework5.utils
+import hw5
 
 DESC = sys.modules[globals()['__name__']].__doc__
 PARSER = argparse.ArgumentParser(description=DESC)
@@ -27,16 +30,53 @@ PARSER.add_argument('-d', '--delay', type=float, default=0.0,
 PARSER.add_argument('-b', '--buffer', type=int, default=2,
                     help="The size of the buffer to simulate (defaults to "
                          "2 packets).")
+PARSER.add_argument('--profile', default=None,
+                    help="A JSON file of link profile fields to pass on to "
+                         "the wire (see server.py --help).")
+PARSER.add_argument('--corrupt', type=float, default=None,
+                    help="Have the wire flip a bit in this fraction of "
+                         "packets, and report how many damaged packets the "
+                         "receiver dropped.")
+PARSER.add_argument('--seed', type=int, default=None,
+                    help="Seed for the wire's random choices, so a run can "
+                         "be repeated exactly.")
+PARSER.add_argument('-w', '--window', type=int, default=None,
+                    help="The number of unacknowledged packets the sender "
+                         "keeps in flight (defaults to the sender's own "
+                         "default).")
+PARSER.add_argument('--fec', action="store_true",
+                    help="Have the sender send parity packets, and report "
+                         "how many lost packets the receiver rebuilt from "
+                         "them.")
+PARSER.add_argument('-c', '--compress', choices=("zlib", "lzma"),
+                    default=None,
+                    help="Have the sender compress the file with this codec.")
 PARSER.add_argument('-f', '--file', required=True,
                     help="The file to send over the wire.")
 PARSER.add_argument('-r', '--receive', default=None,
                     help="The path to write the received file to.  If not "
                          "provided, the results will be written to a temp "
                          "file.")
+PARSER.add_argument('-t', '--timeout', type=float, default=300,
+                    help="The number of seconds to give the sender before "
+                         "stopping it and counting the run as failed "
+                         "(defaults to 300).")
 PARSER.add_argument('-s', '--summary', action="store_true",
                     help="Print a one line summary of whether the "
                          "transaction was successful, instead of a more "
                          "verbose description of the result.")
+PARSER.add_argument('--json', default=None,
+                    help="A path to write the results to as a JSON object, "
+                         "including the sender's and receiver's counts of "
+                         "sent, resent and rebuilt packets.")
+PARSER.add_argument('--telemetry', default=None,
+                    help="A directory to write the sender's and receiver's "
+                         "timelines of the transfer to, as sender.csv and "
+                         "receiver.csv.")
+PARSER.add_argument('--plot', default=None,
+                    help="A path to save a plot of the sender's timeline "
+                         "(segments sent, congestion window and RTT over "
+                         "time) to.  Needs matplotlib.")
 PARSER.add_argument('-v', '--verbose', action="store_true",
                     help="Enable extra verbose mode.")
 ARGS = PARSER.parse_args()
@@ -55,9 +95,101 @@ for AN_ARG in ("port", "loss", "delay", "buffer"):
     SERVER_ARGS.append("--" + AN_ARG)
     SERVER_ARGS.append(str(getattr(ARGS, AN_ARG)))
 
+for AN_ARG in ("profile", "corrupt", "seed"):
+    if getattr(ARGS, AN_ARG) is not None:
+        SERVER_ARGS.append("--" + AN_ARG)
+        SERVER_ARGS.append(str(getattr(ARGS, AN_ARG)))
+
 SERVER_PROCESS = None
 RECEIVING_PROCESS = None
 
+
+def stats_path():
+    """Returns a new temp file path for a process to write its stats to."""
+    handle, path = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    return path
+
+
+def read_stats(path):
+    """Reads, and removes, the stats a process wrote to `path`, returning
+    None if it never wrote them."""
+    try:
+        with open(path) as stats_file:
+            return json.load(stats_file)
+    except (OSError, ValueError):
+        LOGGER.error("Process did not write its stats to {}".format(path))
+        return None
+    finally:
+        os.remove(path)
+
+
+def plot_telemetry(timeline_path, plot_path):
+    """Plots a sender timeline CSV, as written by hw5.Telemetry, to an image
+    file: one panel each for segments sent over time, the congestion window,
+    and RTT samples against the estimate and timeout they led to."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as pyplot
+    except ImportError:
+        LOGGER.error("Plotting needs matplotlib (pip install matplotlib)")
+        return
+
+    with open(timeline_path, newline="") as timeline_file:
+        rows = list(csv.DictReader(timeline_file))
+
+    def series(event, *columns, where=None):
+        picked = [row for row in rows if row["event"] == event and
+                  (where is None or where(row))]
+        return [[float(row[column]) for row in picked]
+                for column in ("time",) + columns]
+
+    figure, (sends, window, rtt) = pyplot.subplots(3, 1, sharex=True,
+                                                   figsize=(10, 9))
+    sends.plot(*series("send", "seq", where=lambda row: row["resent"] ==
+                       "False"), ".", markersize=2, label="sent")
+    sends.plot(*series("send", "seq", where=lambda row: row["resent"] ==
+                       "True"), "x", color="red", label="resent")
+    for time_at in series("timeout")[0]:
+        sends.axvline(time_at, color="grey", linewidth=0.5)
+    sends.set_ylabel("segment")
+    sends.legend()
+    window.plot(*series("ack", "cwnd"), label="cwnd")
+    window.plot(*series("ack", "ssthresh"), label="ssthresh")
+    window.set_ylabel("segments")
+    window.legend()
+    rtt_times, samples, estimates, timeouts = series(
+        "rtt", "sample", "estimated_rtt", "timeout_interval")
+    rtt.plot(rtt_times, samples, ".", markersize=2, label="sample")
+    rtt.plot(rtt_times, estimates, label="estimated")
+    rtt.plot(rtt_times, timeouts, label="timeout")
+    rtt.set_ylabel("seconds")
+    rtt.set_xlabel("time (s)")
+    rtt.legend()
+    figure.savefig(plot_path)
+
+
+# How long to wait for the wire and the receiver to say they are ready, and
+# for the receiver to exit once the sender is done (which, if the sender's
+# CLOSE is lost, can take as long as it lingers for a resent FIN), before
+# giving up on them.
+STARTUP_TIMEOUT = 10
+EXIT_TIMEOUT = 10 + 2 * ARGS.delay + hw5.MAX_FIN_WAIT
+
+
+def start_when_ready(args):
+    """Starts a process that takes a --ready-fd argument, and waits until it
+    reports that it is ready."""
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(args + ["--ready-fd", str(write_fd)],
+                               pass_fds=(write_fd,))
+    os.close(write_fd)
+    if not homework5.utils.wait_ready(read_fd, STARTUP_TIMEOUT):
+        LOGGER.error("Process {} did not become ready".format(process.pid))
+    return process
+
+
 # Make sure we kill and cleanup the other processes if something goes wrong
 # in the server, sender, or receiver.
 def on_end(signal, frame):
@@ -73,9 +205,8 @@ for A_SIGNAL in (signal.SIGTERM, signal.SIGINT):
     signal.signal(A_SIGNAL, on_end)
 
 
-SERVER_PROCESS = subprocess.Popen(SERVER_ARGS)
-LOGGER.info("Starting wire process: {}".format(SERVER_PROCESS.pid))
-time.sleep(1)
+SERVER_PROCESS = start_when_ready(SERVER_ARGS)
+LOGGER.info("Started wire process: {}".format(SERVER_PROCESS.pid))
 
 if ARGS.receive:
     DEST_FILE_PATH = ARGS.receive
@@ -88,55 +219,130 @@ RECEIVING_ARGS = [PYTHON_BINARY, "receiver.py",
                   "--port", str(ARGS.port),
                   "--file", DEST_FILE_PATH]
 
+TELEMETRY_DIR = ARGS.telemetry
+if ARGS.plot and not TELEMETRY_DIR:
+    TELEMETRY_DIR = tempfile.mkdtemp()
+if TELEMETRY_DIR:
+    os.makedirs(TELEMETRY_DIR, exist_ok=True)
+    RECEIVING_ARGS.append("--telemetry")
+    RECEIVING_ARGS.append(os.path.join(TELEMETRY_DIR, "receiver.csv"))
+
+RECV_STATS_PATH = None
+if ARGS.fec or ARGS.corrupt or ARGS.json:
+    RECV_STATS_PATH = stats_path()
+    RECEIVING_ARGS.append("--stats")
+    RECEIVING_ARGS.append(RECV_STATS_PATH)
+
 if ARGS.verbose:
     RECEIVING_ARGS.append("-v")
 
-RECEIVING_PROCESS = subprocess.Popen(RECEIVING_ARGS)
-LOGGER.info("Starting receiving process: {}".format(RECEIVING_PROCESS.pid))
-time.sleep(1)
+RECEIVING_PROCESS = start_when_ready(RECEIVING_ARGS)
+LOGGER.info("Started receiving process: {}".format(RECEIVING_PROCESS.pid))
 
 SENDER_ARGS = [PYTHON_BINARY, "sender.py",
                "--port", str(ARGS.port),
                "--file", ARGS.file]
 
+if ARGS.window is not None:
+    SENDER_ARGS.append("--window")
+    SENDER_ARGS.append(str(ARGS.window))
+
+if ARGS.fec:
+    SENDER_ARGS.append("--fec")
+
+if ARGS.compress is not None:
+    SENDER_ARGS.append("--compress")
+    SENDER_ARGS.append(ARGS.compress)
+
+if TELEMETRY_DIR:
+    SENDER_ARGS.append("--telemetry")
+    SENDER_ARGS.append(os.path.join(TELEMETRY_DIR, "sender.csv"))
+
+SEND_STATS_PATH = None
+if ARGS.json:
+    SEND_STATS_PATH = stats_path()
+    SENDER_ARGS.append("--stats")
+    SENDER_ARGS.append(SEND_STATS_PATH)
+
 if ARGS.verbose:
     SENDER_ARGS.append("-v")
 
 INPUT_PATH = pathlib.Path(ARGS.file)
-INPUT_LEN, INPUT_HASH = homework5.utils.file_summary(INPUT_PATH)
 START_TIME = time.time()
 
 LOGGER.info("Starting sending process: {}".format(SERVER_PROCESS.pid))
-SENDING_RESULT = subprocess.run(SENDER_ARGS)
+TIMED_OUT = False
+try:
+    subprocess.run(SENDER_ARGS, timeout=ARGS.timeout)
+except subprocess.TimeoutExpired:
+    LOGGER.error("Sending process did not finish in {} seconds, "
+                 "killed it".format(ARGS.timeout))
+    TIMED_OUT = True
 
 END_TIME = time.time()
 
-# Sleep the delay time, to allow the buffer to drain.
-time.sleep(ARGS.delay)
-RECEIVING_PROCESS.terminate()
+# The receiver exits on its own once the transfer is closed; only stop it
+# if it is stuck.
+try:
+    RECEIVING_PROCESS.wait(EXIT_TIMEOUT)
+except subprocess.TimeoutExpired:
+    LOGGER.error("Receiving process did not exit, terminating it")
+    RECEIVING_PROCESS.terminate()
+    RECEIVING_PROCESS.wait()
 RECEIVING_PROCESS = None
 SERVER_PROCESS.terminate()
 SERVER_PROCESS = None
 
+# Hash the sent and received files side by side, a block at a time.
 RECV_PATH = pathlib.Path(DEST_FILE_PATH)
-RECV_LEN, RECV_HASH = homework5.utils.file_summary(RECV_PATH)
+SUMMARIES = dict(homework5.utils.file_summaries([INPUT_PATH, RECV_PATH]))
+INPUT_LEN, INPUT_HASH = SUMMARIES[INPUT_PATH]
+RECV_LEN, RECV_HASH = SUMMARIES[RECV_PATH]
+
+if ARGS.plot:
+    plot_telemetry(os.path.join(TELEMETRY_DIR, "sender.csv"), ARGS.plot)
 
-IS_SUCCESS = RECV_HASH == INPUT_HASH
+IS_SUCCESS = not TIMED_OUT and RECV_HASH == INPUT_HASH
 NUM_SECONDS = END_TIME - START_TIME
 RATE = round(((RECV_LEN / NUM_SECONDS) / 1000), 2)
 TEMPLATE = "[{}] latency={}ms, packet loss={}%, buffer={}, throughput={} Kb/s"
+RECV_STATS = read_stats(RECV_STATS_PATH) if RECV_STATS_PATH else None
+SEND_STATS = read_stats(SEND_STATS_PATH) if SEND_STATS_PATH else None
+FEC_RECOVERIES = CORRUPTED = None
+if RECV_STATS is not None:
+    FEC_RECOVERIES = RECV_STATS["fec_recoveries"]
+    CORRUPTED = RECV_STATS["corrupted"]
+if ARGS.fec:
+    TEMPLATE += ", fec recoveries={fec}"
+if ARGS.corrupt:
+    TEMPLATE += ", corrupted={corrupted}"
+if ARGS.json:
+    with open(ARGS.json, "w") as JSON_FILE:
+        json.dump({
+            "success": IS_SUCCESS,
+            "timed_out": TIMED_OUT,
+            "seconds": NUM_SECONDS,
+            "input_bytes": INPUT_LEN,
+            "received_bytes": RECV_LEN,
+            "sender": SEND_STATS,
+            "receiver": RECV_STATS,
+        }, JSON_FILE)
 if ARGS.summary:
     SUMMARY = TEMPLATE.format(
+        "TIMEOUT" if TIMED_OUT else
         "SUCCESS" if IS_SUCCESS else "INCORRECT",
         round(ARGS.delay * 1000),
         round(ARGS.loss * 100, 2),
         ARGS.buffer,
-        RATE
+        RATE,
+        fec=FEC_RECOVERIES,
+        corrupted=CORRUPTED
     )
     print(SUMMARY)
 else:
     print("\n")
-    print("Success" if IS_SUCCESS else "Incorrect")
+    print("Timed out" if TIMED_OUT else
+          "Success" if IS_SUCCESS else "Incorrect")
     print("===\n")
 
     print("Input")
@@ -152,4 +358,8 @@ else:
     print("\nStats")
     print("---")
     print("Time: {} secs\nRate: {} kB/s".format(round(NUM_SECONDS, 2), RATE))
+    if ARGS.fec:
+        print("FEC recoveries: {}".format(FEC_RECOVERIES))
+    if ARGS.corrupt:
+        print("Corrupted packets dropped: {}".format(CORRUPTED))
 sys.exit(0 if IS_SUCCESS else 1)
@@ -2,22 +2,38 @@
 war card game client and server
 """
 import asyncio
-from collections import namedtuple
+from collections import Counter, deque
 from enum import Enum
+import itertools
+import json
 import logging
+import multiprocessing
 import random
+import signal
 import socket
+import struct
 # import socketserver  # commented out to pass pylint (unused imports)
 # import _thread
 import sys
 
 
-# Namedtuples work like classes, but are much more lightweight so they end
-# up being faster. It would be a good idea to keep objects in each of these
-# for each game which contain the game's state, for instance things like the
-# socket, the cards given, the cards still available, etc.
-Game = namedtuple("Game",
-                  ["sock1", "sock2", "port1", "port2", "cards1", "cards2"])
+class Game:
+    """
+    The state of one game: each client's connection and port, and the cards
+    each still holds.  A hand is a bitmask with bit i set for card i, so
+    checking and playing a card are single bit operations, and a game's
+    state is a few small objects rather than two lists of 26 ints.
+    """
+    __slots__ = ("conn1", "conn2", "port1", "port2", "hand1", "hand2")
+
+    def __init__(self, conn1, conn2, port1, port2, hand1, hand2):
+        self.conn1 = conn1
+        self.conn2 = conn2
+        self.port1 = port1
+        self.port2 = port2
+        self.hand1 = hand1
+        self.hand2 = hand2
+
 
 """
 Mapping indices to cards to make cards comparison more straightforward.
@@ -51,6 +67,48 @@ index_to_card = {
     51: (14, "spades"),  # Ace
 }
 
+# Rank of each card, indexed by card, for comparing cards without looking
+# them up in index_to_card.
+RANKS = bytes(index_to_card[card][0] for card in range(52))
+
+# A hand holding every card (see `Game`).
+FULL_DECK = (1 << 52) - 1
+
+
+# Bytes of receive buffer per connection.  A client that pipelines every
+# message of a game sends 2 + 26 * 2 = 54 bytes, so this holds all of it.
+RECV_BUFFER_SIZE = 64
+
+# The only valid 'want game' message.
+WANTGAME_MESSAGE = bytes([0, 0])
+
+# Connections the kernel queues for accept(), so bursts of clients arriving
+# at once aren't turned away (the kernel may cap it at net.core.somaxconn).
+LISTEN_BACKLOG = 4096
+
+# Seconds a new connection has to send its 'want game' message before it is
+# dropped without ever being paired.
+WANTGAME_TIMEOUT = 10
+
+# How a pair of clients is handed to a worker process (see `serve_game`):
+# both clients' ports and how many bytes each had sent past its 'want game'
+# message, followed by those bytes, with the two sockets attached.
+PAIR_HEADER = struct.Struct("!HHBB")
+PAIR_MESSAGE_SIZE = PAIR_HEADER.size + 2 * RECV_BUFFER_SIZE
+
+# Seconds between reports of how many games have been played, and the
+# most bytes a worker's report takes.
+STATS_INTERVAL = 5
+STATS_MESSAGE_SIZE = 4096
+
+# This process's counts of finished and killed games, and of clients dropped
+# before they were paired.  Worker processes report theirs to the parent.
+STATS = Counter()
+
+# Seconds a game waits for both clients' messages in a round (or for both
+# results to be sent) before it treats the game as stalled and kills it.
+ROUND_TIMEOUT = 10
+
 
 class Command(Enum):
     """
@@ -71,26 +129,134 @@ class Result(Enum):
     LOSE = 2
 
 
-async def readexactly(sock, numbytes, loop):
+# Messages the server sends, built once rather than for every game or round.
+# PLAY_RESULT_RESPONSES maps the result of compare_cards to the PLAYRESULT
+# messages for the first and second client.
+GAMESTART_PREFIX = bytes([Command.GAMESTART.value])
+PLAY_RESULT_RESPONSES = {
+    -1: (bytes([Command.PLAYRESULT.value, Result.LOSE.value]),
+         bytes([Command.PLAYRESULT.value, Result.WIN.value])),
+    0: (bytes([Command.PLAYRESULT.value, Result.DRAW.value]),
+        bytes([Command.PLAYRESULT.value, Result.DRAW.value])),
+    1: (bytes([Command.PLAYRESULT.value, Result.WIN.value]),
+        bytes([Command.PLAYRESULT.value, Result.LOSE.value]))
+}
+PLAYCARD = Command.PLAYCARD.value
+
+
+class Connection:
+    """
+    A client's socket, with a receive buffer of its own. TCP may split a
+    message over several reads, or deliver several messages (from a client
+    that pipelines its plays) in one, so reads go into the buffer and
+    messages are cut out of it, rather than each message being one recv.
+    """
+    __slots__ = ("sock", "_loop", "_buffer", "_view", "_start", "_end")
+
+    def __init__(self, sock, loop, unread=b""):
+        self.sock = sock
+        self._loop = loop
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        # bytes received on the socket before it was handed over
+        self._buffer[:len(unread)] = unread
+        self._start = 0  # first byte not yet handed out
+        self._end = len(unread)  # end of the bytes received so far
+
+    async def readexactly(self, numbytes):
+        """
+        Accumulate exactly `numbytes` from the socket and return those, as
+        a view into the buffer that is only valid until the next read.
+        Raises IncompleteReadError, like StreamReader.readexactly(), if EOF
+        is found first.
+        """
+        if self._end - self._start < numbytes:
+            await self._fill(numbytes)
+        start = self._start
+        self._start += numbytes
+        return self._view[start:self._start]
+
+    async def _fill(self, numbytes):
+        """Receive until the buffer holds at least `numbytes`."""
+        # move the start of a split message to the front, to make room for
+        # the rest of it
+        pending = self._end - self._start
+        self._buffer[:pending] = self._buffer[self._start:self._end]
+        self._start, self._end = 0, pending
+        while self._end < numbytes:
+            received = await self._loop.sock_recv_into(
+                self.sock, self._view[self._end:])
+            if not received:
+                raise asyncio.IncompleteReadError(
+                    bytes(self._view[:self._end]), numbytes)
+            self._end += received
+
+    def unread(self):
+        """The bytes received that haven't been read yet."""
+        return bytes(self._view[self._start:self._end])
+
+    def hung_up(self):
+        """
+        Whether the client has closed its end of the connection, checked
+        without waiting and without consuming anything it sent.
+        """
+        try:
+            return not self.sock.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    async def sendall(self, data):
+        """Send all of `data` to the client."""
+        await self._loop.sock_sendall(self.sock, data)
+
+    def close(self):
+        """Close the socket."""
+        self.sock.close()
+
+
+async def both(coro1, coro2):
     """
-    Accumulate exactly `numbytes` from `sock` and return those. If EOF is found
-    before numbytes have been received, be sure to account for that here or in
-    the caller.
+    Run one coroutine for each client at once, and return both results, so
+    a round costs the slower client's latency rather than the sum of both.
+    If either fails, the other is cancelled before the error is raised.
     """
-    # This function works similarly to StreamReader.readexactly() in a way
-    # that it may throw the same Exception.
-    received_bytes = await loop.sock_recv(sock, numbytes)
-    if len(received_bytes) < numbytes:
-        raise asyncio.streams.IncompleteReadError(received_bytes, numbytes)
-    return list(received_bytes)
+    tasks = [asyncio.ensure_future(coro1), asyncio.ensure_future(coro2)]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def read_both(game, numbytes):
+    """
+    Read a `numbytes` message from each client of a game, waiting at most
+    ROUND_TIMEOUT seconds for both.
+    """
+    return await asyncio.wait_for(
+        both(game.conn1.readexactly(numbytes),
+             game.conn2.readexactly(numbytes)),
+        ROUND_TIMEOUT)
+
+
+async def send_both(game, data1, data2):
+    """
+    Send a message to each client of a game, waiting at most ROUND_TIMEOUT
+    seconds for both.
+    """
+    await asyncio.wait_for(
+        both(game.conn1.sendall(data1), game.conn2.sendall(data2)),
+        ROUND_TIMEOUT)
 
 
 def kill_game(game):
     """
     If either client sends a bad message, immediately nuke the game.
     """
-    game.sock1.close()
-    game.sock2.close()
+    game.conn1.close()
+    game.conn2.close()
 
 
 def compare_cards(card1, card2):
@@ -99,124 +265,358 @@ def compare_cards(card1, card2):
     0 for card1 = card2, and 1 for card1 > card2
     """
     # Only comparing cards' rank, ignore suite
-    rank1 = index_to_card[card1][0]
-    rank2 = index_to_card[card2][0]
+    rank1 = RANKS[card1]
+    rank2 = RANKS[card2]
     return 0 if rank1 == rank2 else (1 if rank1 > rank2 else -1)
 
 
 def deal_cards():
     """
-    Randomize a deck of cards (list of ints 0..51), and return two
-    26 card "hands."
+    Randomize a deck of cards (ints 0..51), and return two 26 card "hands,"
+    as bitmasks (see `Game`).
+    """
+    hand = 0
+    for card in random.sample(range(52), 26):
+        hand |= 1 << card
+    return hand, FULL_DECK ^ hand
+
+
+def hand_cards(hand):
+    """The cards in a hand bitmask, as bytes, lowest first."""
+    return bytes(card for card in range(52) if hand >> card & 1)
+
+
+def start_worker():
+    """
+    Fork a worker process to play games in, and return the process and the
+    parent's end of the channel it is handed games over.
+    """
+    # SEQPACKET keeps each handed off pair and each report in one message,
+    # and lets either side see when the other closes its end
+    channel, worker_channel = socket.socketpair(socket.AF_UNIX,
+                                                socket.SOCK_SEQPACKET)
+    process = multiprocessing.Process(target=run_worker,
+                                      args=(worker_channel,), daemon=True)
+    process.start()
+    worker_channel.close()
+    return process, channel
+
+
+def hand_off(loop, channel, backlog, conn1, port1, conn2, port2):
+    """
+    Pass a pair of clients to a worker process to play their game, along
+    with anything they sent that hasn't been read yet, and close this
+    process's copies of their sockets once it has them.  The channel is
+    non-blocking, so a worker that is behind never stalls this process:
+    the pair waits in `backlog`, the channel's pairs not yet sent, until
+    the channel is writable.
     """
-    deck = list(range(0, 52))
-    random.shuffle(deck)
-    logging.debug(deck)
-    return deck[:len(deck) // 2], deck[len(deck) // 2:]
+    unread1, unread2 = conn1.unread(), conn2.unread()
+    message = (PAIR_HEADER.pack(port1, port2, len(unread1), len(unread2)) +
+               unread1 + unread2)
+    backlog.append((message, conn1, conn2))
+    if len(backlog) == 1:
+        send_backlog(loop, channel, backlog)
 
 
-def serve_game(host, port):
+def send_backlog(loop, channel, backlog):
+    """
+    Send the pairs waiting in `backlog` over `channel` until it would
+    block, and wait for it to be writable again if any are left.
+    """
+    while backlog:
+        message, conn1, conn2 = backlog[0]
+        try:
+            socket.send_fds(channel, [message],
+                            [conn1.sock.fileno(), conn2.sock.fileno()])
+        except BlockingIOError:
+            loop.add_writer(channel.fileno(), send_backlog, loop, channel,
+                            backlog)
+            return
+        except OSError as error:
+            STATS["games_killed"] += 1
+            port1, port2, _, _ = PAIR_HEADER.unpack_from(message)
+            logging.info("Couldn't hand the game of clients %s and %s to a "
+                         "worker (%r). Killing game.", port1, port2, error)
+        backlog.popleft()
+        conn1.close()
+        conn2.close()
+    loop.remove_writer(channel.fileno())
+
+
+def run_worker(channel):
+    """
+    Play the games handed off by the parent process over `channel`, and
+    report STATS back over it every STATS_INTERVAL seconds, until the parent
+    closes its end.
+    """
+    # the parent decides when to stop, and tells us by closing the channel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # don't deal the same sequence of hands as every other worker
+    random.seed()
+    STATS.clear()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    channel.setblocking(False)
+
+    def receive_pairs():
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(channel,
+                                                     PAIR_MESSAGE_SIZE, 2)
+            except BlockingIOError:
+                return
+            if not message:
+                loop.stop()
+                return
+            port1, port2, size1, size2 = PAIR_HEADER.unpack_from(message)
+            unread = message[PAIR_HEADER.size:]
+            conns = []
+            for fd, data in zip(fds, (unread[:size1], unread[size1:])):
+                sock = socket.socket(fileno=fd)
+                sock.setblocking(False)
+                conns.append(Connection(sock, loop, data))
+            hand_1, hand_2 = deal_cards()
+            loop.create_task(start_game(Game(conns[0], conns[1], port1,
+                                             port2, hand_1, hand_2)))
+
+    def report():
+        try:
+            channel.send(json.dumps(STATS).encode())
+        except BlockingIOError:
+            pass  # the parent is busy; the next report will catch up
+        loop.call_later(STATS_INTERVAL, report)
+
+    loop.add_reader(channel.fileno(), receive_pairs)
+    loop.call_later(STATS_INTERVAL, report)
+    loop.run_forever()
+
+    # a last report, so the parent's totals are complete
+    channel.setblocking(True)
+    try:
+        channel.send(json.dumps(STATS).encode())
+    except OSError:
+        pass
+    channel.close()
+    loop.close()
+
+
+def serve_game(host, port, workers=1):
     """
     Open a socket for listening for new connections on host:port, and
     perform the war protocol to serve a game of war between each client.
     This function should run forever, continually serving clients.
+
+    With more than one worker, games are played in that many forked worker
+    processes, to use more than one core.  This process still accepts every
+    client and pairs them up in one lobby, so any two clients can be
+    paired, then hands each pair's sockets to the next worker in turn.  It
+    logs the games played by all of them together.
     """
+    # fork before this process has a listening socket or an event loop for
+    # the workers to inherit
+    processes, channels = [], []
+    for _ in range(workers if workers > 1 else 0):
+        process, channel = start_worker()
+        channel.setblocking(False)
+        processes.append(process)
+        channels.append(channel)
+    next_channel = itertools.cycle(channels)
+    # pairs waiting to be handed off, by channel (see `hand_off`)
+    backlogs = {channel: deque() for channel in channels}
+
     welcoming_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     welcoming_socket.bind((host, port))
-    welcoming_socket.listen()
+    welcoming_socket.listen(LISTEN_BACKLOG)
     welcoming_socket.setblocking(False)
     logging.info("The server is ready to accept connections.")
 
     loop = asyncio.get_event_loop()
 
+    # latest STATS reported by each worker, by channel
+    reports = {}
+
+    def read_report(channel):
+        try:
+            message = channel.recv(STATS_MESSAGE_SIZE)
+        except BlockingIOError:
+            return
+        if not message:
+            loop.remove_reader(channel.fileno())
+            return
+        reports[channel] = json.loads(message)
+
+    def totals():
+        total = Counter(STATS)
+        for report in reports.values():
+            total.update(report)
+        return total
+
+    def log_stats(last_finished=0):
+        total = totals()
+        logging.info("%d games finished (%.1f/s), %d killed, %d clients "
+                     "dropped", total["games_finished"],
+                     (total["games_finished"] - last_finished) /
+                     STATS_INTERVAL, total["games_killed"],
+                     total["clients_dropped"])
+        loop.call_later(STATS_INTERVAL, log_stats, total["games_finished"])
+
+    for channel in channels:
+        loop.add_reader(channel.fileno(), read_report, channel)
+    # a single process already logs every game it plays
+    if channels:
+        loop.call_later(STATS_INTERVAL, log_stats)
+
+    # (connection, port) of clients that have asked for a game and are
+    # waiting for another client to play against, longest waiting first
+    lobby = deque()
+
+    async def matchmake(conn, client_port):
+        """
+        Wait for a new client's 'want game' message, then start a game
+        against the longest waiting client that is still connected, or
+        wait in the lobby for the next one.  Clients are only ever paired
+        once they have asked for a game, so one that never does can't
+        hold up a partner.
+        """
+        try:
+            request = await asyncio.wait_for(conn.readexactly(2),
+                                             WANTGAME_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                OSError) as error:
+            conn.close()
+            STATS["clients_dropped"] += 1
+            logging.info("Client %s never asked for a game (%r). Dropping.",
+                         client_port, error)
+            return
+        if request != WANTGAME_MESSAGE:
+            conn.close()
+            STATS["clients_dropped"] += 1
+            logging.info("Bad 'want game' message received from client %s."
+                         " Dropping.", client_port)
+            return
+
+        while lobby:
+            partner, partner_port = lobby.popleft()
+            if not partner.hung_up():
+                break
+            partner.close()
+            logging.info("Client %s left the lobby.", partner_port)
+        else:
+            lobby.append((conn, client_port))
+            logging.info("Client %s is waiting for another client...",
+                         client_port)
+            return
+
+        logging.info("Clients %s and %s paired. Game starts.",
+                     partner_port, client_port)
+        if channels:
+            channel = next(next_channel)
+            hand_off(loop, channel, backlogs[channel], partner, partner_port,
+                     conn, client_port)
+            return
+        hand_1, hand_2 = deal_cards()
+        await start_game(Game(partner, conn, partner_port, client_port,
+                              hand_1, hand_2))
+
     # Wrap infinite while-loop to an async function so it can be executed
     # by loop.run_until_complete()
     async def accept_clients():
         while True:
-            # wait for 2 clients to form a game
-            c1_socket, c1_address = await loop.sock_accept(welcoming_socket)
-            logging.info("Client with port: %s connected."
-                         " Waiting for another client...", c1_address[1])
-            c2_socket, c2_address = await loop.sock_accept(welcoming_socket)
-            logging.info("Client with port: %s connected."
-                         " Game starts.", c2_address[1])
-
-            # create new game
-            hand_1, hand_2 = deal_cards()
-            new_game = Game(c1_socket, c2_socket,
-                            c1_address[1], c2_address[1], hand_1, hand_2)
+            c_socket, c_address = await loop.sock_accept(welcoming_socket)
+            logging.info("Client with port: %s connected.", c_address[1])
 
             # schedule the task to run, but DO NOT wait for it to finish.
             # In other words, fire and forget.
-            loop.create_task(start_game(new_game, loop))
+            loop.create_task(matchmake(Connection(c_socket, loop),
+                                       c_address[1]))
 
     try:
         loop.run_until_complete(accept_clients())
     except KeyboardInterrupt:
+        # have the workers send their final counts and exit
+        for channel in channels:
+            loop.remove_writer(channel.fileno())
+            for _, conn1, conn2 in backlogs[channel]:
+                conn1.close()
+                conn2.close()
+            channel.shutdown(socket.SHUT_WR)
+        for channel in channels:
+            loop.remove_reader(channel.fileno())
+            channel.setblocking(True)
+            message = channel.recv(STATS_MESSAGE_SIZE)
+            while message:
+                reports[channel] = json.loads(message)
+                message = channel.recv(STATS_MESSAGE_SIZE)
+            channel.close()
+        for process in processes:
+            process.join()
+        total = totals()
+        logging.info("Served %d games (%d killed, %d clients dropped).",
+                     total["games_finished"], total["games_killed"],
+                     total["clients_dropped"])
         loop.close()
 
 
-async def start_game(game, loop):
+async def start_game(game):
     """
-    A coroutine to run a game. When there are 2 clients available,
-    a game is started.
+    A coroutine to run a game. When there are 2 clients that have asked
+    for a game, a game is started.
     """
-    # available cards to ensure clients do not play the same card twice
-    # or card not in possession
-    c1_available_cards = game.cards1
-    c2_available_cards = game.cards2
-
-    # Server receiving "want game" command from clients
-    logging.info("Receiving 'want game' command from "
-                 "clients %s and %s.", game.port1, game.port2)
-    c1_request = await readexactly(game.sock1, 2, loop)
-    c2_request = await readexactly(game.sock2, 2, loop)
-
-    if c1_request != [Command.WANTGAME.value, 0] \
-            or c2_request != [Command.WANTGAME.value, 0]:
+    try:
+        finished = await play_game(game)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+            OSError) as error:
+        # a client stalled, hung up early or reset the connection
         kill_game(game)
-        logging.info("Bad 'want game' message received from "
-                     "clients %s and %s. Quitting.", game.port1, game.port2)
-        return
+        logging.info("Game of clients %s and %s died (%r). Quitting.",
+                     game.port1, game.port2, error)
+        finished = False
+    STATS["games_finished" if finished else "games_killed"] += 1
 
+
+async def play_game(game):
+    """
+    Play the war protocol with both clients of a game, reading their
+    messages and sending them results concurrently.  Returns whether all
+    26 rounds were played.
+    """
     # Server sending "game start" command and dealt cards to clients
     logging.info("Sending 'game start' command to "
                  "clients %s and %s", game.port1, game.port2)
-    await loop.sock_sendall(game.sock1,
-                            bytes([Command.GAMESTART.value] + game.cards1))
-    await loop.sock_sendall(game.sock2,
-                            bytes([Command.GAMESTART.value] + game.cards2))
+    await send_both(game, GAMESTART_PREFIX + hand_cards(game.hand1),
+                    GAMESTART_PREFIX + hand_cards(game.hand2))
 
     # running 26 rounds is mandatory
     for i in range(0, 26):
         # expecting 'play card' commands
-        c1_request = await readexactly(game.sock1, 2, loop)
-        c2_request = await readexactly(game.sock2, 2, loop)
+        c1_request, c2_request = await read_both(game, 2)
 
         # extract commands and cards
         c1_cmd, c1_card_play = parse_request(c1_request)
         c2_cmd, c2_card_play = parse_request(c2_request)
 
         # check for valid commands
-        if c1_cmd != Command.PLAYCARD.value \
-                or c2_cmd != Command.PLAYCARD.value:
+        if c1_cmd != PLAYCARD or c2_cmd != PLAYCARD:
             kill_game(game)
             logging.info("Bad 'play card' commands received from "
                          "clients %s and %s. Quitting.",
                          game.port1, game.port2)
-            return
+            return False
 
-        # check for valid cards played
-        if c1_card_play not in c1_available_cards \
-                or c2_card_play not in c2_available_cards:
+        # check for valid cards played: each must still be in the hand, so
+        # no card is played twice or without being dealt
+        c1_card_bit = 1 << c1_card_play
+        c2_card_bit = 1 << c2_card_play
+        if not game.hand1 & c1_card_bit or not game.hand2 & c2_card_bit:
             kill_game(game)
             logging.info("Invalid card detected. Killing game of "
                          "clients %s and %s.", game.port1, game.port2)
-            return
+            return False
 
         # update available cards for next rounds
-        c1_available_cards.remove(c1_card_play)
-        c2_available_cards.remove(c2_card_play)
+        game.hand1 ^= c1_card_bit
+        game.hand2 ^= c2_card_bit
 
         # evaluate result
         compare_result = compare_cards(c1_card_play, c2_card_play)
@@ -224,39 +624,32 @@ async def start_game(game, loop):
         # create 'play result' responses
         c1_response, c2_response = make_play_result_responses(compare_result)
 
-        # building logging string
-        result_string = ("It's draw." if compare_result == 0
-                         else (f"client{game.port1} wins."
-                               if compare_result > 0
-                               else f"client{game.port2} wins."))
-        logging.info("Round %d: client%s: %s | client%s: %s -> %s",
-                     i, game.port1, index_to_card[c1_card_play], game.port2,
-                     index_to_card[c2_card_play], result_string)
+        # building logging string, only if it will be logged
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            result_string = ("It's draw." if compare_result == 0
+                             else (f"client{game.port1} wins."
+                                   if compare_result > 0
+                                   else f"client{game.port2} wins."))
+            logging.debug("Round %d: client%s: %s | client%s: %s -> %s",
+                          i, game.port1, index_to_card[c1_card_play],
+                          game.port2, index_to_card[c2_card_play],
+                          result_string)
 
         # send responses
-        await loop.sock_sendall(game.sock1, c1_response)
-        await loop.sock_sendall(game.sock2, c2_response)
+        await send_both(game, c1_response, c2_response)
 
     # disconnect clients when 26 rounds are played
     kill_game(game)
     logging.info("Game of client %s and "
                  "client %s has finished.", game.port1, game.port2)
-    return
+    return True
 
 
 def make_play_result_responses(result):
     """
     Create responses for the 2 clients given the result of a round: [-1, 0, 1]
     """
-    result_to_response = {
-        -1: (bytes([Command.PLAYRESULT.value, Result.LOSE.value]),
-             bytes([Command.PLAYRESULT.value, Result.WIN.value])),
-        0: (bytes([Command.PLAYRESULT.value, Result.DRAW.value]),
-            bytes([Command.PLAYRESULT.value, Result.DRAW.value])),
-        1: (bytes([Command.PLAYRESULT.value, Result.WIN.value]),
-            bytes([Command.PLAYRESULT.value, Result.LOSE.value]))
-    }
-    return result_to_response[result]
+    return PLAY_RESULT_RESPONSES[result]
 
 
 def parse_request(request):
@@ -279,7 +672,7 @@ async def client(host, port, loop):
     You do not need to change this function.
     """
     try:
-        reader, writer = await asyncio.open_connection(host, port, loop=loop)
+        reader, writer = await asyncio.open_connection(host, port)
         # send want game
         writer.write(b"\0\0")
         card_msg = await reader.readexactly(27)
@@ -318,9 +711,13 @@ def main(args):
     host = args[1]
     port = int(args[2])
     if args[0] == "server":
+        # server HOST PORT [--workers N]
+        workers = 1
+        if "--workers" in args:
+            workers = int(args[args.index("--workers") + 1])
         try:
             # your server should serve clients until the user presses ctrl+c
-            serve_game(host, port)
+            serve_game(host, port, workers)
         except KeyboardInterrupt:
             pass
         return